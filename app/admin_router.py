@@ -1,9 +1,10 @@
 import os
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 from fastapi import APIRouter, Depends, Header, HTTPException, Query
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from sqlalchemy import desc, func
 from sqlalchemy.orm import Session
 
@@ -43,41 +44,47 @@ def verify_admin(x_admin_key: str = Header(..., alias="x-admin-key")):
         raise HTTPException(status_code=401, detail="Invalid admin key")
 
 
+def _clear_vto_lookup_cache() -> None:
+    """Drop cached VTO product lookups after the catalogue changes."""
+    from app.vto_agent import _lookup
+    _lookup.cache_clear()
+
+
 # ---------------------------------------------------------------------------
 # Request / response schemas
 # ---------------------------------------------------------------------------
 
 class ProductCreate(BaseModel):
     product_name: str
-    category: str
+    category: str = Field(max_length=32)
     price: float
     description: str
     image_url: Optional[str] = None
-    colour: str
+    colour: str = Field(max_length=64)
 
 
 class ProductUpdate(BaseModel):
     product_name: Optional[str] = None
-    category: Optional[str] = None
+    category: Optional[str] = Field(None, max_length=32)
     price: Optional[float] = None
     description: Optional[str] = None
     image_url: Optional[str] = None
-    colour: Optional[str] = None
+    colour: Optional[str] = Field(None, max_length=64)
 
 
 class InventoryCreate(BaseModel):
     product_id: int
-    size: str
-    stock_quantity: int = 0
+    size: str = Field(max_length=16)
+    stock_quantity: int = Field(0, ge=0, le=32767)   # SMALLINT column
 
 
 class InventoryUpdate(BaseModel):
-    size: Optional[str] = None
-    stock_quantity: Optional[int] = None
+    size: Optional[str] = Field(None, max_length=16)
+    stock_quantity: Optional[int] = Field(None, ge=0, le=32767)
 
 
 class OrderStatusUpdate(BaseModel):
-    status: str
+    status: str = Field(max_length=32)
 
 
 # ---------------------------------------------------------------------------
@@ -213,6 +220,7 @@ def create_product(
     product = Product(**body.model_dump())
     db.add(product)
     db.commit()
+    _clear_vto_lookup_cache()
     db.refresh(product)
     return _product_payload(product, db)
 
@@ -230,6 +238,7 @@ def update_product(
     for field, value in body.model_dump(exclude_none=True).items():
         setattr(product, field, value)
     db.commit()
+    _clear_vto_lookup_cache()
     db.refresh(product)
     return _product_payload(product, db)
 
@@ -369,6 +378,10 @@ def update_order_status(
             status_code=400,
             detail=f"Invalid status. Must be one of: {sorted(VALID_STATUSES)}",
         )
+    try:
+        uuid.UUID(order_id)  # order_id is a native UUID column on postgres
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Order not found")
     order = db.query(Order).filter(Order.order_id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -458,11 +471,15 @@ def list_restock_notifications(
 # ---------------------------------------------------------------------------
 
 @router.post("/import-excel")
-def import_excel(_: None = Depends(verify_admin)):
+def import_excel(
+    force: bool = Query(False, description="Re-import even if the spreadsheet is unchanged"),
+    _: None = Depends(verify_admin),
+):
     """Trigger a manual Excel import. Use when bulk-loading from the spreadsheet."""
     try:
         from app.db_builder import populate_initial_data
-        populate_initial_data()
+        populate_initial_data(force=force)
+        _clear_vto_lookup_cache()
         return {"success": True, "message": "Excel import completed."}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
@@ -32,7 +32,7 @@ from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
 from app.chat_with_rag import create_rag_chain
 from app.sales_tools import (
-    create_draft_order, confirm_order_details,
+    create_draft_order, create_draft_order_bulk, confirm_order_details,
     view_cart, remove_from_cart, get_order_status,
 )
 from app.observability import configure_langsmith, run_metadata
@@ -148,7 +148,7 @@ async def tool_lifespan():
         )
         mcp_tools_list = await mcp_client.get_tools()
         sales_tools_list = [
-            create_draft_order, confirm_order_details,
+            create_draft_order, create_draft_order_bulk, confirm_order_details,
             view_cart, remove_from_cart, get_order_status,
         ]
 
@@ -491,6 +491,7 @@ SALES_SYSTEM = """You are the Sales Agent for Pamorya, a premium Sri Lankan fash
 
 **TOOLS AVAILABLE:**
 - `create_draft_order(product_name, size, quantity, thread_id)` — adds item to cart
+- `create_draft_order_bulk(items, thread_id)` — adds several items (each product_name, size, quantity) in one call
 - `view_cart(thread_id)` — shows current cart
 - `remove_from_cart(product_name, thread_id)` — removes item
 - `confirm_order_details(customer_name, address, phone, thread_id)` — confirms COD order
@@ -502,7 +503,7 @@ SALES_SYSTEM = """You are the Sales Agent for Pamorya, a premium Sri Lankan fash
 
 2. **Get size and quantity**: If the user just said a size (e.g. "M", "medium", "size 10"), pair it with the product from context. Default quantity is 1 unless stated.
 
-3. **Call create_draft_order**: Once you have product + size. Show the total and delivery estimate from the response.
+3. **Call create_draft_order**: Once you have product + size. Show the total and delivery estimate from the response. If the user wants several items at once, call `create_draft_order_bulk` once instead of `create_draft_order` per item.
 
 4. **Handle OUT_OF_STOCK**: If returned, apologise and list the available sizes clearly.
 
@@ -559,7 +560,7 @@ async def data_query_tool_executor_node(state: AgentState, config: RunnableConfi
     for tc in last_message.tool_calls:
         name = tc["name"]
         args = dict(tc["args"])
-        if name in {"create_draft_order", "confirm_order_details", "view_cart", "remove_from_cart"}:
+        if name in {"create_draft_order", "create_draft_order_bulk", "confirm_order_details", "view_cart", "remove_from_cart"}:
             args["thread_id"] = thread_id
         logger.info(" -> tool=%s args=%s", name, args)
         t = data_tool_lookup.get(name)
@@ -1265,6 +1266,10 @@ async def create_memory() -> object:
             logger.warning("PostgreSQL checkpointer failed (%s) — falling back to SQLite", exc)
 
     conn = await aiosqlite.connect("checkpoints.db")
+    # One connection for the server's lifetime; WAL lets status reads proceed
+    # while a run is writing checkpoints, and NORMAL sync skips an fsync per commit.
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
     logger.info("Checkpointer: SQLite (local dev)")
     return AsyncSqliteSaver(conn=conn)
 
@@ -44,9 +44,9 @@ def _get_embeddings():
     if _embeddings_instance is not None:
         return _embeddings_instance
     try:
-        from langchain_huggingface import HuggingFaceEmbeddings
+        from app.embeddings import make_embeddings
 
-        _embeddings_instance = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        _embeddings_instance = make_embeddings()
         logger.info("SemanticCache: HuggingFace MiniLM embeddings loaded")
     except Exception as e:
         logger.warning("SemanticCache: embeddings unavailable (%s)", e)
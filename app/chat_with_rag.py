@@ -3,12 +3,13 @@ import logging
 from dotenv import load_dotenv
 
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 
+from app.embeddings import embedding_model_tag, make_embeddings, read_index_tag
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -22,6 +23,32 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
 INDEX_PATH = os.path.join(project_root, "faiss_index")
 
+# Inverted lists probed per query on IVF indexes (see rag_indexer)
+RAG_NPROBE = int(os.getenv("RAG_NPROBE", "16"))
+
+
+def _tune_index(index):
+    try:
+        import faiss
+        faiss.extract_index_ivf(index).nprobe = RAG_NPROBE
+    except Exception:
+        pass  # flat index — exact search, nothing to tune
+
+
+def _mmap_io_flags(index_file):
+    """faiss read flags that map the index file instead of copying it into RAM.
+
+    Flat indexes need IO_FLAG_MMAP_IFC (zero-copy codes); IVF indexes need
+    IO_FLAG_MMAP (on-disk inverted lists). The two don't combine, so pick by
+    the index's fourcc header.
+    """
+    import faiss
+
+    with open(index_file, "rb") as f:
+        fourcc = f.read(4)
+    mmap = faiss.IO_FLAG_MMAP_IFC if fourcc.startswith(b"IxF") else faiss.IO_FLAG_MMAP
+    return mmap | faiss.IO_FLAG_READ_ONLY
+
 
 def create_rag_chain():
     """RAG chain for policy/brand questions. LLM: Gemini Flash, Embeddings: HuggingFace MiniLM."""
@@ -33,18 +60,38 @@ def create_rag_chain():
         google_api_key=GOOGLE_API_KEY,
     )
 
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    embeddings = make_embeddings()
 
     index_file = os.path.join(INDEX_PATH, "index.faiss")
     if not os.path.exists(index_file):
         logger.warning("FAISS index not found at %s — RAG disabled", index_file)
         return None
 
+    # An untagged index predates the tag file, i.e. an FP32 build — treat it
+    # like any other mismatch rather than query it with int8 ONNX vectors.
+    index_tag, query_tag = read_index_tag(INDEX_PATH), embedding_model_tag(embeddings)
+    if index_tag != query_tag:
+        logger.warning(
+            "FAISS index was embedded with %s but queries use %s — RAG disabled; "
+            "rebuild it with app.rag_indexer", index_tag or "an untagged model", query_tag,
+        )
+        return None
+
     try:
-        db = FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+        # Pages fault in on demand and are shared by every worker mapping the file
+        db = FAISS.load_local(
+            INDEX_PATH, embeddings,
+            allow_dangerous_deserialization=True,
+            io_flags=_mmap_io_flags(index_file),
+        )
     except Exception as e:
-        logger.warning("Failed to load FAISS index: %s — RAG disabled", e)
-        return None
+        logger.warning("mmap load of FAISS index failed (%s) — reading into memory", e)
+        try:
+            db = FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+        except Exception as e:
+            logger.warning("Failed to load FAISS index: %s — RAG disabled", e)
+            return None
+    _tune_index(db.index)
     retriever = db.as_retriever(search_kwargs={"k": 3})
 
     def format_docs(docs):
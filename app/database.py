@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -22,5 +22,37 @@ if not _is_sqlite:
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs)
 
+if _is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        # WAL lets readers run alongside the writer; busy_timeout waits on a
+        # locked DB instead of raising OperationalError straight away.
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA busy_timeout=5000")
+        # 20 MB page cache and a 256 MB mmap window keep hot product lookups
+        # off the read() path.
+        cur.execute("PRAGMA cache_size=-20000")
+        cur.execute("PRAGMA mmap_size=268435456")
+        # Sorts and temp indexes from GROUP BY / ORDER BY stay in RAM
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def dialect_insert(bind):
+    """insert() construct for the bound dialect, with on_conflict_* support.
+
+    Returns None on dialects other than postgres/sqlite.
+    """
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
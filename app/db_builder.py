@@ -1,9 +1,22 @@
+import csv
+import hashlib
+import io
+import numpy as np
 import pandas as pd
 import os
 import re
 import traceback
-from app.database import engine, SessionLocal
-from app.models import Base, Product, Inventory, VtoSession
+from sqlalchemy import func
+from app.database import engine, SessionLocal, dialect_insert
+from app.models import Base, Product, Inventory, VtoSession, SeedMeta
+
+# Rust-based calamine parser is several times faster than openpyxl for the
+# stock sheet; fall back to pandas' default engine when it isn't installed.
+try:
+    import python_calamine  # type: ignore  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
 
 
 def init_db():
@@ -13,6 +26,25 @@ def init_db():
     _apply_column_migrations()
 
 
+def _narrow_column(table, column, type_sql):
+    """Postgres ALTER COLUMN ... TYPE that is a no-op once the column already has that type."""
+    if type_sql.startswith("VARCHAR("):
+        data_type = "character varying"
+        length = type_sql[len("VARCHAR("):-1]
+    else:
+        data_type, length = type_sql.lower(), "NULL"
+    return f"""
+            DO $$ BEGIN
+              IF EXISTS (SELECT 1 FROM information_schema.columns
+                         WHERE table_name = '{table}' AND column_name = '{column}'
+                           AND (data_type <> '{data_type}'
+                                OR character_maximum_length IS DISTINCT FROM {length})) THEN
+                ALTER TABLE {table} ALTER COLUMN {column} TYPE {type_sql};
+              END IF;
+            END $$
+            """
+
+
 def _apply_column_migrations():
     """ADD COLUMN IF NOT EXISTS for columns added after initial deploy.
     Safe to run on every startup — postgres IF NOT EXISTS makes it idempotent."""
@@ -23,19 +55,133 @@ def _apply_column_migrations():
         "ALTER TABLE orders ADD COLUMN IF NOT EXISTS thread_id VARCHAR",
         # stripe_payment_id nullable extension
         "ALTER TABLE orders ADD COLUMN IF NOT EXISTS stripe_payment_id VARCHAR",
+        # FK / lookup indexes added after tables already existed in prod
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_products_name_colour ON products (product_name, colour)",
+        "CREATE INDEX IF NOT EXISTS ix_inventory_product_id ON inventory (product_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_inventory_product_size ON inventory (product_id, size)",
+        "CREATE INDEX IF NOT EXISTS ix_orders_customer_id ON orders (customer_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_orders_pending_customer ON orders (customer_id) "
+        "WHERE status = 'pending_payment'",
+        "CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_returns_order_id ON returns (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_restock_notifications_product_id ON restock_notifications (product_id)",
     ]
+    if engine.dialect.name == "postgresql":
+        # Narrowed column types. sqlite can't ALTER COLUMN (and ignores VARCHAR
+        # lengths anyway). Each is guarded so the ACCESS EXCLUSIVE rewrite only
+        # happens once; a value that no longer fits makes its statement fail
+        # and get skipped, leaving that column unchanged.
+        migrations += [
+            _narrow_column("inventory", "size", "VARCHAR(16)"),
+            _narrow_column("inventory", "stock_quantity", "SMALLINT"),
+            _narrow_column("products", "category", "VARCHAR(32)"),
+            _narrow_column("products", "colour", "VARCHAR(64)"),
+            _narrow_column("orders", "status", "VARCHAR(32)"),
+            _narrow_column("returns", "status", "VARCHAR(32)"),
+            _narrow_column("restock_notifications", "size", "VARCHAR(16)"),
+            _narrow_column("restock_notifications", "status", "VARCHAR(32)"),
+            # order ids VARCHAR → native UUID; FKs must be dropped and re-added
+            # around the type change. Skipped if any stored id isn't a uuid.
+            """
+            DO $$ BEGIN
+              IF (SELECT data_type FROM information_schema.columns
+                  WHERE table_name = 'orders' AND column_name = 'order_id') <> 'uuid' THEN
+                ALTER TABLE order_items DROP CONSTRAINT IF EXISTS order_items_order_id_fkey;
+                ALTER TABLE returns DROP CONSTRAINT IF EXISTS returns_order_id_fkey;
+                ALTER TABLE orders ALTER COLUMN order_id TYPE UUID USING order_id::uuid;
+                ALTER TABLE order_items ALTER COLUMN order_id TYPE UUID USING order_id::uuid;
+                ALTER TABLE returns ALTER COLUMN order_id TYPE UUID USING order_id::uuid;
+                ALTER TABLE order_items ADD CONSTRAINT order_items_order_id_fkey
+                  FOREIGN KEY (order_id) REFERENCES orders (order_id);
+                ALTER TABLE returns ADD CONSTRAINT returns_order_id_fkey
+                  FOREIGN KEY (order_id) REFERENCES orders (order_id);
+              END IF;
+            END $$
+            """,
+            # Trigram GIN index: lets the ILIKE '%name%' product lookups in
+            # sales_tools, vto_agent and the admin search use an index
+            # instead of scanning every row.
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products "
+            "USING gin (product_name gin_trgm_ops)",
+        ]
     with engine.connect() as conn:
         for sql in migrations:
+            # Savepoint per statement: on postgres one failure would otherwise
+            # abort the transaction and silently skip every later migration.
             try:
-                conn.execute(__import__("sqlalchemy").text(sql))
+                with conn.begin_nested():
+                    conn.execute(__import__("sqlalchemy").text(sql))
             except Exception as e:
                 print(f"Migration skipped ({e})")
         conn.commit()
     print("--- ✅ Column migrations applied ---")
 
 
+_WS = re.compile(r'\s+')
+
+
 def clean_column_name(col_name):
-    return re.sub(r'\s+', ' ', str(col_name)).strip()
+    return _WS.sub(' ', str(col_name)).strip()
+
+
+def clean_header_row(values) -> list:
+    """clean_column_name over a raw header row; blank cells become ''."""
+    return [clean_column_name('' if pd.isna(v) else v) for v in values]
+
+
+def _combine_headers(row0, row1):
+    return [
+        f"{r0} {r1}" if (r0 and r1 and r0 != r1) else (r1 if r1 else r0)
+        for r0, r1 in zip(row0, row1)
+    ]
+
+
+# Same placeholders pd.read_excel treats as missing by default, so both
+# parse paths hand identical frames to the cleaning steps below.
+_NA_STRINGS = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a',
+    'nan', 'null',
+})
+
+
+def _cell(value):
+    if value is None or (isinstance(value, str) and value in _NA_STRINGS):
+        return np.nan
+    return value
+
+
+def _read_sheet_streaming(excel_path):
+    """Stream the first sheet with openpyxl in read-only mode.
+
+    Returns ``(headers, rows)``. Used when calamine isn't installed so the
+    sheet is parsed once, row by row, instead of being loaded twice through
+    ``pd.read_excel`` for header detection.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        row0 = next(rows, ())
+        if "Dress Name" in row0:
+            headers = [
+                str(h) if h is not None else f"Unnamed: {i}"
+                for i, h in enumerate(row0)
+            ]
+        else:
+            row1 = next(rows, ())
+            headers = _combine_headers(
+                clean_header_row(row0),
+                clean_header_row(row1),
+            )
+        data = [
+            [_cell(v) for v in r] for r in rows if any(v is not None for v in r)
+        ]
+    finally:
+        wb.close()
+    return headers, data
 
 
 def clean_prefix(value, prefix):
@@ -57,15 +203,20 @@ def clean_name(name: str) -> str:
     name = re.sub(r'\*+', '', name)                         # stray *
     name = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', name)  # zero-width chars
     name = re.sub(r'^\?+\s*', '', name)                     # leading ?
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = _WS.sub(' ', name).strip()
     return name
 
 
-def is_sold_out(row):
-    for val in row.values:
-        if isinstance(val, str) and "sold out" in val.lower():
-            return True
-    return False
+def sold_out_mask(df: pd.DataFrame) -> np.ndarray:
+    """Boolean mask of rows where any text cell mentions 'sold out'."""
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        mask |= (
+            df[col].astype(str)
+            .str.contains("sold out", case=False, regex=False, na=False)
+            .to_numpy(dtype=bool)
+        )
+    return mask
 
 
 def detect_category(name: str, description: str, is_set_bundle: bool = False) -> str:
@@ -143,14 +294,6 @@ def find_common_prefix(names: list) -> str:
     return " ".join(common)
 
 
-def _safe_img(img) -> str | None:
-    """Return the image URL string or None if the value is empty/NaN."""
-    if img is None:
-        return None
-    s = str(img).strip()
-    return s if s and s.lower() != 'nan' else None
-
-
 def upsert_product(db, name, category, price, desc, img, colour, size, qty):
     existing = db.query(Product).filter(
         Product.product_name == name,
@@ -177,7 +320,7 @@ def upsert_product(db, name, category, price, desc, img, colour, size, qty):
         db.flush()
         prod_id = new_prod.product_id
 
-    if size is not None and str(size).strip().upper() not in ('', 'NAN', 'NONE'):
+    if _valid_size(size):
         clean_size = str(size).strip().upper()
         inv = db.query(Inventory).filter(
             Inventory.product_id == prod_id,
@@ -189,8 +332,318 @@ def upsert_product(db, name, category, price, desc, img, colour, size, qty):
             db.add(Inventory(product_id=prod_id, size=clean_size, stock_quantity=qty))
 
 
-def populate_initial_data():
-    db = SessionLocal()
+def _valid_size(size):
+    return size is not None and str(size).strip().upper() not in ('', 'NAN', 'NONE')
+
+
+def stage_product(products, stock, name, category, price, desc, img, colour, size, qty):
+    """Record an upsert_product() call in memory for bulk_upsert().
+
+    Later calls win, except that a missing image never clears an earlier one
+    — the same rules upsert_product() applies row by row.
+    """
+    key = (name, colour)
+    prev = products.get(key)
+    products[key] = {
+        "category": category,
+        "price": price,
+        "description": desc,
+        "image_url": img or (prev["image_url"] if prev else None),
+    }
+    if _valid_size(size):
+        stock[(name, colour, str(size).strip().upper())] = qty
+
+
+_UPSERT_BATCH = 500
+
+
+def bulk_upsert(db, products, stock):
+    """INSERT ... ON CONFLICT DO UPDATE staged products, then their stock.
+
+    Falls back to per-row upsert_product() on dialects without ON CONFLICT or
+    on legacy databases where the unique indexes couldn't be created.
+    """
+    if _is_first_postgres_seed(db):
+        try:
+            with db.begin_nested():
+                _copy_seed(db, products, stock)
+            return
+        except Exception as e:
+            print(f"⚠️ COPY seed unavailable ({type(e).__name__}) — using batched upserts")
+
+    insert = dialect_insert(db.get_bind())
+    if insert is not None:
+        try:
+            with db.begin_nested():
+                _bulk_upsert(db, insert, products, stock)
+            return
+        except Exception as e:
+            print(f"⚠️ Bulk upsert unavailable ({type(e).__name__}) — falling back to row-by-row sync")
+
+    for (name, colour), p in products.items():
+        upsert_product(db, name, p["category"], p["price"], p["description"],
+                       p["image_url"], colour, None, 0)
+    # stock keys are unique, so pending Inventory rows never need a flush
+    for (name, colour, size), qty in stock.items():
+        p = products[(name, colour)]
+        upsert_product(db, name, p["category"], p["price"], p["description"],
+                       p["image_url"], colour, size, qty)
+
+
+def _is_first_postgres_seed(db):
+    return (
+        db.get_bind().dialect.name == "postgresql"
+        and db.query(Product.product_id).first() is None
+    )
+
+
+def _copy_seed(db, products, stock):
+    """First sync into an empty postgres DB: COPY both tables in one go.
+
+    products is empty, so inventory (FK → products) is too and there is
+    nothing to conflict with. product_ids are assigned here and the serial
+    sequence is moved past them afterwards.
+    """
+    ids = {key: i for i, key in enumerate(products, start=1)}
+    prod_buf, inv_buf = io.StringIO(), io.StringIO()
+    # Explicit NULL marker so a blank string and a missing image stay distinct
+    w = csv.writer(prod_buf)
+    for (name, colour), p in products.items():
+        w.writerow([ids[(name, colour)], name, p["category"], p["price"],
+                    p["description"], p["image_url"] or r"\N", colour])
+    w = csv.writer(inv_buf)
+    for (name, colour, size), qty in stock.items():
+        w.writerow([ids[(name, colour)], size, qty])
+    prod_buf.seek(0)
+    inv_buf.seek(0)
+
+    # Raw DBAPI cursor on the session's own connection, so COPY joins the
+    # surrounding transaction. copy_expert is psycopg2's COPY API.
+    cur = db.connection().connection.dbapi_connection.cursor()
+    try:
+        cur.copy_expert(
+            "COPY products (product_id, product_name, category, price, "
+            "description, image_url, colour) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            prod_buf,
+        )
+        cur.copy_expert(
+            "COPY inventory (product_id, size, stock_quantity) FROM STDIN WITH (FORMAT csv)",
+            inv_buf,
+        )
+        cur.execute(
+            "SELECT setval(pg_get_serial_sequence('products', 'product_id'), "
+            "GREATEST((SELECT MAX(product_id) FROM products), 1))"
+        )
+    finally:
+        cur.close()
+
+
+def _bulk_upsert(db, insert, products, stock):
+    rows = [{"product_name": n, "colour": c, **fields} for (n, c), fields in products.items()]
+    ids = {}
+    for i in range(0, len(rows), _UPSERT_BATCH):
+        stmt = insert(Product).values(rows[i:i + _UPSERT_BATCH])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["product_name", "colour"],
+            set_={
+                "category": stmt.excluded.category,
+                "price": stmt.excluded.price,
+                "description": stmt.excluded.description,
+                "image_url": func.coalesce(stmt.excluded.image_url, Product.image_url),
+            },
+        ).returning(Product.product_id, Product.product_name, Product.colour)
+        ids.update({(n, c): pid for pid, n, c in db.execute(stmt)})
+
+    inv_rows = [
+        {"product_id": ids[(n, c)], "size": sz, "stock_quantity": qty}
+        for (n, c, sz), qty in stock.items()
+    ]
+    for i in range(0, len(inv_rows), _UPSERT_BATCH):
+        stmt = insert(Inventory).values(inv_rows[i:i + _UPSERT_BATCH])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["product_id", "size"],
+            set_={"stock_quantity": stmt.excluded.stock_quantity},
+        )
+        db.execute(stmt)
+
+
+def _read_stock_sheet(excel_path):
+    if EXCEL_ENGINE is None:
+        headers, rows = _read_sheet_streaming(excel_path)
+        return pd.DataFrame(rows, columns=headers)
+
+    df_check = pd.read_excel(excel_path, engine=EXCEL_ENGINE)
+    if "Dress Name" in df_check.columns:
+        return df_check
+    df_raw = pd.read_excel(excel_path, header=None, engine=EXCEL_ENGINE)
+    df = df_raw.iloc[2:].copy()
+    df.columns = _combine_headers(
+        clean_header_row(df_raw.iloc[0].tolist()),
+        clean_header_row(df_raw.iloc[1].tolist()),
+    )
+    return df
+
+
+# Header normalisation: exact matches first, then the first rule whose
+# needles all appear in the lower-cased header wins.
+_EXACT_RENAMES = {"size": "Quantity Size"}
+_RENAME_RULES = (
+    (("size", "quantity"), "Quantity Size"),
+    (("quantity",), "Quantity for each"),
+    (("image",), "image_url"),
+    (("unit price",), "Unit Price (LKR)"),
+    (("full set",), "Full set Price"),
+    (("set price",), "Full set Price"),
+    (("description",), "Dress description"),
+)
+
+# Product-level fields forward-filled down each product's size rows.
+# IMPORTANT: 'Full set Price' is intentionally EXCLUDED — see _clean_stock_frame.
+_PRODUCT_COLS = frozenset({
+    'Dress Code', 'Dress Name', 'Colour',
+    'Dress description', 'Unit Price (LKR)', 'image_url',
+})
+
+# Columns the sync reads, with the fill value used when a sheet lacks one
+_STOCK_COLUMNS = {
+    'Dress Name': '',
+    'Colour': '',
+    'Dress description': '',
+    'image_url': '',
+    'Unit Price (LKR)': np.nan,
+    'Full set Price': np.nan,
+    'Quantity Size': '',
+    'Quantity for each': 0,
+}
+
+
+def _clean_stock_frame(df):
+    """Raw sheet → one tidy row per size, typed and ready for the sync.
+
+    Text columns are stripped strings ('' when missing), prices are floats,
+    quantities int64 (zeroed for sold-out products) and sizes upper-cased
+    ('' when the row carries no valid size).
+    """
+    # --- Clean column prefixes ---
+    print("--- 🧹 Cleaning Data Prefixes... ---")
+    for col, prefix in {
+        'Dress Name': 'Dress Name',
+        'Colour': 'Colour',
+        'Dress description': 'Dress description',
+    }.items():
+        if col in df.columns:
+            df[col] = [clean_prefix(x, prefix) for x in df[col].tolist()]
+
+    # --- Normalise column names ---
+    col_map = {}
+    for col in df.columns:
+        c = col.lower().strip()
+        target = _EXACT_RENAMES.get(c)
+        if target is None:
+            for needles, candidate in _RENAME_RULES:
+                if all(n in c for n in needles):
+                    target = candidate
+                    break
+        if target is not None:
+            col_map[col] = target
+    df.rename(columns=col_map, inplace=True)
+
+    # --- Forward-fill product fields across size rows ---
+    # IMPORTANT: 'Full set Price' is intentionally EXCLUDED from this list.
+    # Including it causes downstream products (which have no bundle) to
+    # inherit the previous product's Full set Price via ffill, creating
+    # spurious "Full Set" entries in the database.
+    fill_cols = [c for c in df.columns if c in _PRODUCT_COLS]
+    df[fill_cols] = df[fill_cols].ffill()
+
+    # --- Normalise text columns once, column-wise ---
+    for col in ('Dress Name', 'Colour', 'Dress description'):
+        if col in df.columns:
+            df[col] = df[col].where(df[col].notna(), '').astype(str).str.strip()
+    if 'image_url' in df.columns:
+        img = df['image_url'].astype(str).str.strip()
+        has_img = df['image_url'].notna() & img.ne('') & img.str.lower().ne('nan')
+        df['image_url'] = img.where(has_img, '')
+
+    # A "sold out" marker anywhere in a product's rows zeroes all its
+    # sizes.  Must be read before the quantity column is coerced below.
+    sold = sold_out_mask(df)
+    key = df['Dress Name'] + '\x00' + df['Colour']
+    row_sold = key.isin(key[sold]).to_numpy()
+
+    # --- Coerce numeric columns once, column-wise ---
+    for col in ('Unit Price (LKR)', 'Full set Price'):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    if 'Quantity for each' in df.columns:
+        qty = pd.to_numeric(df['Quantity for each'], errors='coerce').fillna(0).astype('int64')
+        df['Quantity for each'] = qty.where(~row_sold, 0)
+
+    if 'Quantity Size' in df.columns:
+        size_raw = df['Quantity Size']
+        size_str = size_raw.astype(str).str.strip().str.upper()
+        size_valid = size_raw.notna() & size_str.ne('') & size_str.ne('NAN')
+        df['Quantity Size'] = size_str.where(size_valid, '')
+
+    for col, fill in _STOCK_COLUMNS.items():
+        if col not in df.columns:
+            df[col] = fill
+    return df[list(_STOCK_COLUMNS)].reset_index(drop=True)
+
+
+# Bump whenever _clean_stock_frame changes what it produces, so frames
+# cached by the old cleaning code are not served.
+_STOCK_CACHE_VERSION = 1
+
+
+def _file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_or_build_cached_df(excel_path, cache_dir, stock_hash=None):
+    """Cleaned stock frame, served from a Parquet cache keyed by the sheet's hash.
+
+    The cache file is named after the workbook's content hash and the
+    cleaning-format version, so a replaced workbook (whatever its mtime) or
+    a change to ``_clean_stock_frame`` always misses. The cache is
+    best-effort: without a Parquet engine (pyarrow) or a writable directory
+    the sheet is simply parsed every time.
+    """
+    if stock_hash is None:
+        stock_hash = _file_hash(excel_path)
+    cache_path = os.path.join(cache_dir, f"stock-{stock_hash}-v{_STOCK_CACHE_VERSION}.parquet")
+    try:
+        df = pd.read_parquet(cache_path)
+        print("--- ⚡ Loaded cleaned stock from cache ---")
+        return df
+    except Exception:
+        pass
+
+    df = _clean_stock_frame(_read_stock_sheet(excel_path))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in os.listdir(cache_dir):
+            if name.startswith("stock") and name.endswith(".parquet"):
+                os.remove(os.path.join(cache_dir, name))
+        df.to_parquet(cache_path, compression='zstd', index=False)
+    except Exception as e:
+        print(f"Stock cache not written ({e})")
+    return df
+
+
+STOCK_HASH_KEY = "stock_hash"
+
+
+def populate_initial_data(force: bool = False):
+    """Sync products/inventory from the stock workbook.
+
+    Skipped when the workbook's hash matches the one recorded by the last
+    successful sync, unless ``force`` is set.
+    """
     try:
         print("--- 📊 Reading Excel for Database Sync... ---")
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -202,67 +655,26 @@ def populate_initial_data():
             print("❌ No Excel file found.")
             return
 
+        stock_hash = _file_hash(excel_path)
+        if not force:
+            try:
+                with SessionLocal() as db:
+                    meta = db.get(SeedMeta, STOCK_HASH_KEY)
+            except Exception:
+                meta = None  # seed_meta not created yet — just sync
+            if meta is not None and meta.value == stock_hash:
+                print("--- ⏭️ Excel unchanged since last sync — skipping ---")
+                return
+
         print(f"--- 📂 Processing: {os.path.basename(excel_path)} ---")
 
+        cache_dir = os.path.join(base_dir, ".cache")
         try:
-            df_check = pd.read_excel(excel_path)
-            if "Dress Name" not in df_check.columns:
-                df_raw = pd.read_excel(excel_path, header=None)
-                row0 = df_raw.iloc[0].fillna('').astype(str).apply(clean_column_name)
-                row1 = df_raw.iloc[1].fillna('').astype(str).apply(clean_column_name)
-                new_headers = [
-                    f"{r0} {r1}" if (r0 and r1 and r0 != r1) else (r1 if r1 else r0)
-                    for r0, r1 in zip(row0, row1)
-                ]
-                df = df_raw.iloc[2:].copy()
-                df.columns = new_headers
-            else:
-                df = df_check
+            df = _load_or_build_cached_df(excel_path, cache_dir, stock_hash)
         except Exception as exc:
             print(f"❌ Error reading Excel: {exc}")
             return
 
-        # --- Clean column prefixes ---
-        print("--- 🧹 Cleaning Data Prefixes... ---")
-        for col, prefix in {
-            'Dress Name': 'Dress Name',
-            'Colour': 'Colour',
-            'Dress description': 'Dress description',
-        }.items():
-            if col in df.columns:
-                df[col] = df[col].astype(str).apply(lambda x: clean_prefix(x, prefix))
-
-        # --- Normalise column names ---
-        col_map = {}
-        for col in df.columns:
-            c = col.lower().strip()
-            if "size" in c and "quantity" in c:
-                col_map[col] = "Quantity Size"
-            elif c == "size":
-                col_map[col] = "Quantity Size"
-            elif "quantity" in c:
-                col_map[col] = "Quantity for each"
-            elif "image" in c:
-                col_map[col] = "image_url"
-            elif "unit price" in c:
-                col_map[col] = "Unit Price (LKR)"
-            elif "full set" in c or "set price" in c:
-                col_map[col] = "Full set Price"
-            elif "description" in c:
-                col_map[col] = "Dress description"
-        df.rename(columns=col_map, inplace=True)
-
-        # --- Forward-fill product fields across size rows ---
-        # IMPORTANT: 'Full set Price' is intentionally EXCLUDED from this list.
-        # Including it causes downstream products (which have no bundle) to
-        # inherit the previous product's Full set Price via ffill, creating
-        # spurious "Full Set" entries in the database.
-        fill_cols = [c for c in df.columns if c in [
-            'Dress Code', 'Dress Name', 'Colour',
-            'Dress description', 'Unit Price (LKR)', 'image_url',
-        ]]
-        df[fill_cols] = df[fill_cols].ffill()
-
         print("--- 🔄 Syncing Individual Products... ---")
 
         # ------------------------------------------------------------------
@@ -275,45 +687,62 @@ def populate_initial_data():
         # Value: {price, img, colour, components: [{name, colour, img, sizes}]}
         # ------------------------------------------------------------------
         set_registry: dict = {}
-        grouped = df.groupby(['Dress Name', 'Colour'])
+        products: dict = {}   # (name, colour) -> product fields
+        stock: dict = {}      # (name, colour, size) -> quantity
+
+        # Product identity as integer codes. Categories sort lexicographically
+        # and '\x00' sorts below every printable char, so a stable argsort on
+        # the codes yields the same (name, colour) order groupby produced.
+        # Each block of `order` holds one product's size rows; the first row
+        # of each block carries the product fields.
+        pid = (df['Dress Name'] + '\x00' + df['Colour']).astype('category').cat.codes.to_numpy()
+        order = np.argsort(pid, kind='stable')
+        _, starts = np.unique(pid[order], return_index=True)
+        blocks = np.split(order, starts[1:]) if len(order) else []
+
+        names = df['Dress Name'].to_numpy()
+        colours = df['Colour'].to_numpy()
+        clean_names = {raw: clean_name(raw) for raw in df['Dress Name'].unique()}
+        skip_names = {raw for raw, name in clean_names.items() if not name or name.lower() == 'nan'}
+
+        size_values = df['Quantity Size'].to_numpy()
+        size_valid = df['Quantity Size'].ne('').to_numpy()
+        qty_values = df['Quantity for each'].to_numpy()
+
+        # Collect sizes and stock quantities for every product block
+        sizes_by_product: dict = {}
+        for block in blocks:
+            key = (names[block[0]], colours[block[0]])
+            if key[0] in skip_names:
+                continue
+            keep = block[size_valid[block]]
+            sizes_by_product[key] = dict(zip(size_values[keep], qty_values[keep].tolist()))
 
-        for (raw_name, colour), group in grouped:
-            name = clean_name(str(raw_name).strip())
-            colour = str(colour).strip()
+        product_rows = df.iloc[order[starts]].to_dict('records')
 
-            if not name or name.lower() in ('nan', ''):
+        for first in product_rows:
+            raw_name, raw_colour = first['Dress Name'], first['Colour']
+            if raw_name in skip_names:
                 continue
+            name = clean_names[raw_name]
+            colour = raw_colour
+            sizes = sizes_by_product[(raw_name, raw_colour)]
 
-            first = group.iloc[0]
-            desc = clean_name(str(first.get('Dress description', '') or '').strip())
-            img = _safe_img(first.get('image_url'))
-            is_sold = any(is_sold_out(r) for _, r in group.iterrows())
-
-            # Collect sizes and stock quantities for this product
-            sizes: dict = {}
-            for _, r in group.iterrows():
-                sz = r.get('Quantity Size')
-                if sz is None or (not isinstance(sz, str) and pd.isna(sz)):
-                    continue
-                sz = str(sz).strip().upper()
-                if not sz or sz in ('NAN', ''):
-                    continue
-                qty_raw = r.get('Quantity for each', 0)
-                qty = 0 if is_sold else int(qty_raw or 0)
-                sizes[sz] = qty
+            desc = clean_name(first['Dress description'])
+            img = first['image_url'] or None
 
             # 1. Individual item ─────────────────────────────────────────
-            u_price = pd.to_numeric(first.get('Unit Price (LKR)'), errors='coerce')
+            u_price = first['Unit Price (LKR)']
             if not pd.isna(u_price) and u_price > 0:
                 cat = detect_category(name, desc, is_set_bundle=False)
-                upsert_product(db, name, cat, float(u_price), desc, img, colour, None, 0)
+                stage_product(products, stock, name, cat, float(u_price), desc, img, colour, None, 0)
                 for sz, qty in sizes.items():
-                    upsert_product(db, name, cat, float(u_price), desc, img, colour, sz, qty)
+                    stage_product(products, stock, name, cat, float(u_price), desc, img, colour, sz, qty)
 
             # 2. Register for Full Set deduplication ─────────────────────
             # NOTE: we read directly from the raw (non-ffilled) first row so
             # we only process products that explicitly declare a set price.
-            s_price = pd.to_numeric(first.get('Full set Price'), errors='coerce')
+            s_price = first['Full set Price']
             if not pd.isna(s_price) and s_price > 0:
                 set_ref = extract_set_reference(desc)
                 if not set_ref:
@@ -356,7 +785,7 @@ def populate_initial_data():
                 b_name = f"{comp_names[0]} - Full Set"
 
             b_colour = components[0]["colour"]
-            b_img = _safe_img(components[0]["img"]) or _safe_img(set_info["img"])
+            b_img = components[0]["img"] or set_info["img"]
             b_desc = (
                 f"Complete co-ord set — includes: {', '.join(comp_names)}. "
                 f"{components[0]['desc']}"
@@ -374,29 +803,29 @@ def populate_initial_data():
                     for sz in common_keys
                 }
 
-            upsert_product(
-                db, b_name, "Sets & Co-ords",
+            stage_product(
+                products, stock, b_name, "Sets & Co-ords",
                 float(set_price), b_desc, b_img, b_colour, None, 0,
             )
             for sz, qty in common_sizes.items():
-                upsert_product(
-                    db, b_name, "Sets & Co-ords",
+                stage_product(
+                    products, stock, b_name, "Sets & Co-ords",
                     float(set_price), b_desc, b_img, b_colour, sz, qty,
                 )
 
-        db.commit()
+        # One transaction for the whole write; commits on exit, rolls back on error
+        with SessionLocal() as db, db.begin(), db.no_autoflush:
+            bulk_upsert(db, products, stock)
+            db.merge(SeedMeta(key=STOCK_HASH_KEY, value=stock_hash))
         print(
             f"✅ Database Sync Complete: "
-            f"{len(grouped)} product groups processed, "
+            f"{len(product_rows)} product groups processed, "
             f"{len(set_registry)} bundle(s) created."
         )
 
     except Exception as exc:
         print(f"❌ DB Sync Error: {exc}")
         traceback.print_exc()
-        db.rollback()
-    finally:
-        db.close()
 
 
 if __name__ == "__main__":
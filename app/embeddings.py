@@ -0,0 +1,83 @@
+"""
+Shared MiniLM embedding factory for the RAG index, RAG queries and the
+semantic cache — index and query vectors must come from the same model.
+
+When onnxruntime + optimum are installed, CPU inference uses the int8
+dynamically-quantized ONNX export that ships in the sentence-transformers
+hub repo (VNNI / AVX2 / ARM kernels). Otherwise it falls back to the plain
+FP32 PyTorch model. Indexing and querying always run on the CPU so both
+sides pick the same backend; the tag of the backend that actually loaded is
+saved next to the FAISS index and checked when the index is opened.
+"""
+import logging
+import os
+import platform
+
+from langchain_huggingface import HuggingFaceEmbeddings
+
+logger = logging.getLogger(__name__)
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+
+
+def _int8_onnx_file():
+    """Pre-quantized ONNX file matching this CPU, or None without onnxruntime."""
+    try:
+        import onnxruntime  # type: ignore  # noqa: F401
+        import optimum.onnxruntime  # type: ignore  # noqa: F401
+    except ImportError:
+        return None
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+# Written next to index.faiss by rag_indexer, checked by chat_with_rag
+INDEX_TAG_FILE = "embedding_model.txt"
+
+
+def embedding_model_tag(embeddings: HuggingFaceEmbeddings) -> str:
+    """Identifies the weights ``embeddings`` actually loaded, for keying stored vectors."""
+    onnx_file = embeddings.model_kwargs.get("model_kwargs", {}).get("file_name")
+    return f"{EMBED_MODEL}:{onnx_file}" if onnx_file else EMBED_MODEL
+
+
+def make_embeddings(**encode_kwargs) -> HuggingFaceEmbeddings:
+    onnx_file = _int8_onnx_file()
+    if onnx_file:
+        try:
+            embeddings = HuggingFaceEmbeddings(
+                model_name=EMBED_MODEL,
+                model_kwargs={"backend": "onnx", "model_kwargs": {"file_name": onnx_file}},
+                encode_kwargs=encode_kwargs,
+            )
+            logger.info("MiniLM embeddings: int8 ONNX (%s)", onnx_file)
+            return embeddings
+        except Exception as e:
+            logger.warning("int8 ONNX MiniLM unavailable (%s) — using FP32", e)
+    return HuggingFaceEmbeddings(
+        model_name=EMBED_MODEL,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs=encode_kwargs,
+    )
+
+
+def read_index_tag(index_path: str):
+    """Tag saved with the FAISS index at ``index_path``, or None for older indexes."""
+    try:
+        with open(os.path.join(index_path, INDEX_TAG_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def write_index_tag(index_path: str, tag: str) -> None:
+    with open(os.path.join(index_path, INDEX_TAG_FILE), "w") as f:
+        f.write(tag)
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, SmallInteger, String, Float, ForeignKey, DateTime, Text, Index, text
+from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 import uuid
 
 Base = declarative_base()
 
+# Native 16-byte uuid on postgres; hyphenated text on sqlite as before.
+# as_uuid=False keeps the Python-side values plain str.
+UUIDString = UUID(as_uuid=False).with_variant(String(36), "sqlite")
+
 
 # --- PRODUCT MANAGEMENT ---
 class Product(Base):
@@ -12,26 +17,32 @@ class Product(Base):
 
     product_id = Column(Integer, primary_key=True, autoincrement=True)
     product_name = Column(String, index=True)
-    category = Column(String)
+    category = Column(String(32))
     price = Column(Float)
     description = Column(Text)
     image_url = Column(Text)  # Changed to Text for long gallery links
-    colour = Column(String)
+    colour = Column(String(64))
 
     # Relationships
     inventory = relationship("Inventory", back_populates="product", cascade="all, delete-orphan")
 
+    # Excel sync identity — conflict target for the seed upsert
+    __table_args__ = (Index("ix_products_name_colour", "product_name", "colour", unique=True),)
+
 
 class Inventory(Base):
     __tablename__ = "inventory"
 
     inventory_id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey("products.product_id"))
-    size = Column(String)
-    stock_quantity = Column(Integer, default=0)
+    product_id = Column(Integer, ForeignKey("products.product_id"), index=True)
+    size = Column(String(16))
+    stock_quantity = Column(SmallInteger, default=0)
 
     product = relationship("Product", back_populates="inventory")
 
+    # One stock row per (product, size) — also the conflict target for upserts
+    __table_args__ = (Index("ix_inventory_product_size", "product_id", "size", unique=True),)
+
 
 # --- CUSTOMER DATA ---
 class Customer(Base):
@@ -51,15 +62,15 @@ class Customer(Base):
 class Order(Base):
     __tablename__ = "orders"
 
-    order_id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    order_id = Column(UUIDString, primary_key=True, default=lambda: str(uuid.uuid4()))
     # Made Nullable so we can start an order without a customer profile yet
-    customer_id = Column(String, ForeignKey("customers.customer_id"), nullable=True)
+    customer_id = Column(String, ForeignKey("customers.customer_id"), nullable=True, index=True)
     # Added thread_id to track which chat session this belongs to
     thread_id = Column(String, index=True, nullable=True)
     # Human-readable order number: PAM-YYYYMMDD-XXXX
     order_number = Column(String, unique=True, nullable=True, index=True)
 
-    status = Column(String, default="Draft")  # Draft, Pending, Paid, Shipped
+    status = Column(String(32), default="Draft")  # Draft, Pending, Paid, Shipped
     total_amount = Column(Float, default=0.0)
     stripe_payment_id = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -67,12 +78,22 @@ class Order(Base):
     customer = relationship("Customer", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    # At most one open cart per customer — lets create_draft_order insert the
+    # cart with ON CONFLICT DO NOTHING instead of read-then-insert.
+    __table_args__ = (
+        Index(
+            "ux_orders_pending_customer", "customer_id", unique=True,
+            sqlite_where=text("status = 'pending_payment'"),
+            postgresql_where=text("status = 'pending_payment'"),
+        ),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    order_id = Column(String, ForeignKey("orders.order_id"))
+    order_id = Column(UUIDString, ForeignKey("orders.order_id"), index=True)
     product_id = Column(Integer, nullable=True)  # Optional link to product ID
     product_name = Column(String)
     size = Column(String)
@@ -87,9 +108,9 @@ class Return(Base):
     __tablename__ = "returns"
 
     return_id = Column(String, primary_key=True)
-    order_id = Column(String, ForeignKey("orders.order_id"))
+    order_id = Column(UUIDString, ForeignKey("orders.order_id"), index=True)
     product_ids = Column(String)  # JSON string of product IDs being returned
-    status = Column(String)
+    status = Column(String(32))
     return_date = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -98,9 +119,9 @@ class RestockNotification(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     customer_email = Column(String)
-    product_id = Column(Integer)
-    size = Column(String)
-    status = Column(String, default="Pending")
+    product_id = Column(Integer, index=True)
+    size = Column(String(16))
+    status = Column(String(32), default="Pending")
 
 
 # --- VIRTUAL TRY-ON SESSIONS (DB-backed, survives restarts) ---
@@ -113,4 +134,12 @@ class VtoSession(Base):
     product_name  = Column(String, nullable=True)
     usage_count   = Column(Integer, default=0)
     usage_date    = Column(String, nullable=True)   # ISO date YYYY-MM-DD
-    updated_at    = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
\ No newline at end of file
+    updated_at    = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+# --- EXCEL SYNC BOOKKEEPING ---
+class SeedMeta(Base):
+    __tablename__ = "seed_meta"
+
+    key        = Column(String(64), primary_key=True)   # e.g. "stock_hash"
+    value      = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
@@ -1,9 +1,39 @@
 import os
 import logging
+import queue
 from functools import wraps
+from logging.handlers import QueueHandler, QueueListener
 
 logger = logging.getLogger(__name__)
 
+_log_listener: QueueListener | None = None
+
+
+def start_queued_logging() -> None:
+    """
+    Put the root logger's handlers behind a queue: request handlers only
+    enqueue records, and a listener thread does the stream writes, so a slow
+    stdout pipe (Railway/journald) never stalls the event loop.
+    """
+    global _log_listener
+    root = logging.getLogger()
+    if _log_listener is not None or not root.handlers:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [QueueHandler(log_queue)]
+    _log_listener.start()
+
+
+def stop_queued_logging() -> None:
+    """Flush queued records and give the root logger its handlers back."""
+    global _log_listener
+    if _log_listener is None:
+        return
+    _log_listener.stop()
+    logging.getLogger().handlers = list(_log_listener.handlers)
+    _log_listener = None
+
 
 def configure_langsmith() -> bool:
     """
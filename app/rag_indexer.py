@@ -1,11 +1,15 @@
 import os
+import hashlib
 import logging
+import numpy as np
 from dotenv import load_dotenv
 
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from app.embeddings import EMBED_MODEL, embedding_model_tag, make_embeddings, write_index_tag
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +21,76 @@ project_root = os.path.dirname(script_dir)
 DATA_PATH = os.path.join(project_root, "data")
 INDEX_PATH = os.path.join(project_root, "faiss_index")
 
+EMBED_CHUNK = 256  # texts handed to embed_documents per call
+EMBED_MAX_TOKENS = 256  # MiniLM max_seq_length; longer chunks are silently truncated
+
+# chunk-hash → vector, so re-indexing only embeds chunks that changed
+EMBED_CACHE_PATH = os.path.join(project_root, ".cache", "embeddings_cache.npz")
+
+# Below this many chunks the exact flat index is tiny and fast, and there
+# isn't enough data to train IVF centroids / PQ codebooks reliably.
+PQ_MIN_CHUNKS = 10_000
+
+
+def _token_splitter():
+    """Same separators as before, but chunk length is counted in MiniLM
+    word-pieces by the model's own (Rust) fast tokenizer, so every chunk fits
+    the embedding window instead of losing its tail to truncation."""
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{EMBED_MODEL}")
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        tokenizer,
+        separators=["---", "\n\n", "\n"],
+        chunk_size=EMBED_MAX_TOKENS - 2,  # room for [CLS] / [SEP]
+        chunk_overlap=32,
+    )
+
+
+def _chunk_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _load_embedding_cache(model_tag):
+    try:
+        with np.load(EMBED_CACHE_PATH) as z:
+            if str(z["model"]) != model_tag:
+                return {}
+            return dict(zip(z["keys"].tolist(), z["vectors"]))
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def _save_embedding_cache(cache, model_tag):
+    try:
+        os.makedirs(os.path.dirname(EMBED_CACHE_PATH), exist_ok=True)
+        keys = list(cache)
+        np.savez_compressed(
+            EMBED_CACHE_PATH,
+            model=np.array(model_tag),
+            keys=np.array(keys),
+            vectors=np.vstack([cache[k] for k in keys]).astype("float32"),
+        )
+    except OSError as e:
+        logger.warning("Embedding cache not saved: %s", e)
+
+
+def _build_compressed_index(vectors):
+    """Trained OPQ32,IVF<sqrt(N)>,PQ32 index — 32 bytes per vector instead of
+    1536, and queries only scan `nprobe` inverted lists. Returns None for
+    small corpora, which keep the default exact IndexFlatL2."""
+    if len(vectors) < PQ_MIN_CHUNKS:
+        return None
+    import faiss
+
+    x = np.asarray(vectors, dtype="float32")
+    nlist = int(np.sqrt(len(x)))
+    logger.info("Training OPQ32,IVF%d,PQ32 index on %d vectors...", nlist, len(x))
+    index = faiss.index_factory(x.shape[1], f"OPQ32,IVF{nlist},PQ32")
+    index.train(x)
+    return index
+
+
 def create_vector_store():
     logger.info("Loading documents from: %s", DATA_PATH)
     loader = DirectoryLoader(
@@ -24,8 +98,12 @@ def create_vector_store():
         glob="**/*.txt",
         loader_cls=TextLoader,
         loader_kwargs={"encoding": "utf-8"},
+        use_multithreading=True,
+        max_concurrency=min(8, os.cpu_count() or 1),
+        silent_errors=True,  # log and skip an unreadable file instead of aborting the build
     )
-    documents = loader.load()
+    # Threads finish in any order; sort so chunk order (and FAISS ids) stay stable
+    documents = sorted(loader.load(), key=lambda d: d.metadata.get("source", ""))
 
     if not documents:
         logger.error("No .txt files found in %s", DATA_PATH)
@@ -33,19 +111,44 @@ def create_vector_store():
 
     logger.info("Loaded %d document(s)", len(documents))
 
-    splitter = RecursiveCharacterTextSplitter(
-        separators=["---", "\n\n", "\n"],
-        chunk_size=1000,
-        chunk_overlap=200,
-    )
-    docs = splitter.split_documents(documents)
+    docs = _token_splitter().split_documents(documents)
     logger.info("Split into %d chunks", len(docs))
 
-    logger.info("Embedding with HuggingFace all-MiniLM-L6-v2...")
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    # Same CPU backend as the query side (chat_with_rag, semantic cache):
+    # a GPU FP32 index queried with int8 ONNX vectors would drift.
+    embeddings = make_embeddings(batch_size=64)
+    model_tag = embedding_model_tag(embeddings)
+    logger.info("Embedding with %s...", model_tag)
+
+    texts = [d.page_content for d in docs]
+    metadatas = [d.metadata for d in docs]
+    hashes = [_chunk_hash(t) for t in texts]
+
+    cache = _load_embedding_cache(model_tag)
+    todo = {h: t for h, t in zip(hashes, texts) if h not in cache}
+    logger.info("%d chunk(s) cached, %d to embed", len(texts) - len(todo), len(todo))
+    todo_hashes, todo_texts = list(todo), list(todo.values())
+    for i in range(0, len(todo_texts), EMBED_CHUNK):
+        batch = embeddings.embed_documents(todo_texts[i:i + EMBED_CHUNK])
+        cache.update(zip(todo_hashes[i:i + EMBED_CHUNK], np.asarray(batch, dtype="float32")))
+
+    vectors = [cache[h] for h in hashes]
+    # Keep only the current chunks so the cache doesn't grow without bound
+    _save_embedding_cache({h: cache[h] for h in hashes}, model_tag)
 
-    db = FAISS.from_documents(docs, embeddings)
+    index = _build_compressed_index(vectors)
+    if index is None:
+        db = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+    else:
+        db = FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+        )
+        db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
     db.save_local(INDEX_PATH)
+    write_index_tag(INDEX_PATH, model_tag)
     logger.info("FAISS index saved to %s", INDEX_PATH)
 
 
@@ -1,13 +1,16 @@
 import json
 import logging
 import uuid
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta, timezone
 
 from langchain_core.tools import tool
+from pydantic import BaseModel
+from sqlalchemy import case, select, update
 from sqlalchemy.exc import OperationalError
 import time
 
-from app.database import SessionLocal
+from app.database import SessionLocal, dialect_insert
 from app.models import Product, Order, OrderItem, Customer, Inventory
 
 logger = logging.getLogger(__name__)
@@ -31,6 +34,44 @@ def execute_with_retry(func, max_retries: int = 3):
     raise Exception("Database is too busy. Please try again.")
 
 
+@contextmanager
+def txn():
+    """One session, one transaction: commit on clean exit, roll back on error."""
+    session = SessionLocal()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _pending_order_id(session, insert, thread_id: str) -> str:
+    """order_id of the customer's open cart, creating it if needed.
+
+    The ux_orders_pending_customer partial unique index makes a concurrent
+    creator's INSERT a no-op; the loser then reads the winner's row.
+    """
+    lookup = select(Order.order_id).where(
+        Order.customer_id == thread_id,
+        Order.status == "pending_payment",
+    )
+    order_id = session.execute(lookup).scalar()
+    if order_id is None:
+        order_id = session.execute(
+            insert(Order)
+            .values(customer_id=thread_id, thread_id=thread_id,
+                    status="pending_payment", total_amount=0.0)
+            .on_conflict_do_nothing()
+            .returning(Order.order_id)
+        ).scalar()
+        if order_id is None:
+            order_id = session.execute(lookup).scalar_one()
+    return order_id
+
+
 def _generate_order_number() -> str:
     date_part = datetime.now(timezone.utc).strftime("%Y%m%d")
     suffix = uuid.uuid4().hex[:4].upper()
@@ -48,6 +89,61 @@ def _next_delivery_date(business_days: int = 4) -> str:
     return current.strftime("%B %d, %Y")
 
 
+def _resolve_cart_item(session, product_name: str, size: str):
+    """(product, size_upper) for an orderable item, or an Error/OUT_OF_STOCK message."""
+    product = session.query(Product).filter(
+        Product.product_name.ilike(f"%{product_name}%")
+    ).first()
+    if not product:
+        return f"Error: Product '{product_name}' not found in our catalogue."
+
+    size_upper = size.strip().upper()
+    inv = session.query(Inventory).filter(
+        Inventory.product_id == product.product_id,
+        Inventory.size == size_upper,
+    ).first()
+
+    if inv is not None and inv.stock_quantity == 0:
+        available = session.query(Inventory).filter(
+            Inventory.product_id == product.product_id,
+            Inventory.stock_quantity > 0,
+        ).all()
+        sizes_list = ", ".join(i.size for i in available) if available else "none currently"
+        return (
+            f"OUT_OF_STOCK: Size {size_upper} is unavailable for "
+            f"{product.product_name}. Available sizes: {sizes_list}"
+        )
+    return product, size_upper
+
+
+def _add_to_cart(session, thread_id: str, rows: list[dict]) -> float:
+    """Insert order_items rows into the open cart in one executemany; returns the new total."""
+    insert = dialect_insert(session.get_bind())
+    session.execute(
+        insert(Customer)
+        .values(customer_id=thread_id, full_name="Guest")
+        .on_conflict_do_nothing()
+    )
+    order_id = _pending_order_id(session, insert, thread_id)
+
+    session.execute(insert(OrderItem), [{**row, "order_id": order_id} for row in rows])
+    # Increment in SQL — no read-modify-write on the Python side
+    return session.execute(
+        update(Order)
+        .where(Order.order_id == order_id)
+        .values(total_amount=Order.total_amount + sum(
+            r["price_at_purchase"] * r["quantity"] for r in rows
+        ))
+        .returning(Order.total_amount)
+    ).scalar_one()
+
+
+class CartItem(BaseModel):
+    product_name: str
+    size: str
+    quantity: int = 1
+
+
 # ---------------------------------------------------------------------------
 # Tools
 # ---------------------------------------------------------------------------
@@ -59,81 +155,69 @@ def create_draft_order(product_name: str, size: str, quantity: int, thread_id: s
                 product_name, size, quantity, thread_id)
 
     def transaction():
-        session = SessionLocal()
-        try:
-            product = session.query(Product).filter(
-                Product.product_name.ilike(f"%{product_name}%")
-            ).first()
-            if not product:
-                return f"Error: Product '{product_name}' not found in our catalogue."
-
-            size_upper = size.strip().upper()
-            inv = session.query(Inventory).filter(
-                Inventory.product_id == product.product_id,
-                Inventory.size == size_upper,
-            ).first()
-
-            if inv is not None and inv.stock_quantity == 0:
-                available = session.query(Inventory).filter(
-                    Inventory.product_id == product.product_id,
-                    Inventory.stock_quantity > 0,
-                ).all()
-                sizes_list = ", ".join(i.size for i in available) if available else "none currently"
-                return (
-                    f"OUT_OF_STOCK: Size {size_upper} is unavailable for "
-                    f"{product.product_name}. Available sizes: {sizes_list}"
-                )
-
-            price = float(product.price)
-            total_line = price * int(quantity)
-
-            customer = session.query(Customer).filter(
-                Customer.customer_id == thread_id
-            ).first()
-            if not customer:
-                customer = Customer(customer_id=thread_id, full_name="Guest")
-                session.add(customer)
-                session.flush()
-
-            order = session.query(Order).filter(
-                Order.customer_id == thread_id,
-                Order.status == "pending_payment",
-            ).first()
-            if not order:
-                order = Order(
-                    customer_id=thread_id,
-                    thread_id=thread_id,
-                    status="pending_payment",
-                    total_amount=0.0,
-                )
-                session.add(order)
-                session.flush()
-
-            item = OrderItem(
-                order_id=order.order_id,
-                product_id=product.product_id,
-                product_name=product.product_name,
-                size=size_upper,
-                quantity=quantity,
-                price_at_purchase=price,
-            )
-            session.add(item)
-            order.total_amount += total_line
-            session.commit()
+        with txn() as session:
+            resolved = _resolve_cart_item(session, product_name, size)
+            if isinstance(resolved, str):
+                return resolved
+            product, size_upper = resolved
+
+            cart_total = _add_to_cart(session, thread_id, [{
+                "product_id": product.product_id,
+                "product_name": product.product_name,
+                "size": size_upper,
+                "quantity": quantity,
+                "price_at_purchase": float(product.price),
+            }])
 
             delivery_estimate = _next_delivery_date(4)
             return (
                 f"SUCCESS: Added {quantity}x {product.product_name} ({size_upper}) to your order. "
-                f"Cart total: LKR {order.total_amount:,.0f}. "
+                f"Cart total: LKR {cart_total:,.0f}. "
                 f"Estimated delivery: {delivery_estimate}. "
                 "Please provide your Full Name, Shipping Address, and Phone Number to confirm."
             )
 
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
+    try:
+        return execute_with_retry(transaction)
+    except Exception as e:
+        return f"System Error: {str(e)}"
+
+
+@tool
+def create_draft_order_bulk(items: list[CartItem], thread_id: str = "guest_user"):
+    """Adds several items to the draft order in one go.
+    Items that are unavailable are skipped and reported; the rest are added."""
+    logger.info("create_draft_order_bulk: %d item(s) thread=%s", len(items), thread_id)
+
+    def transaction():
+        with txn() as session:
+            rows, added, problems = [], [], []
+            for item in items:
+                resolved = _resolve_cart_item(session, item.product_name, item.size)
+                if isinstance(resolved, str):
+                    problems.append(resolved)
+                    continue
+                product, size_upper = resolved
+                rows.append({
+                    "product_id": product.product_id,
+                    "product_name": product.product_name,
+                    "size": size_upper,
+                    "quantity": item.quantity,
+                    "price_at_purchase": float(product.price),
+                })
+                added.append(f"{item.quantity}x {product.product_name} ({size_upper})")
+
+            if not rows:
+                return "\n".join(problems) or "Error: No items given."
+
+            cart_total = _add_to_cart(session, thread_id, rows)
+            lines = [
+                f"SUCCESS: Added {', '.join(added)} to your order. "
+                f"Cart total: LKR {cart_total:,.0f}. "
+                f"Estimated delivery: {_next_delivery_date(4)}. "
+                "Please provide your Full Name, Shipping Address, and Phone Number to confirm."
+            ]
+            return "\n".join(lines + problems)
 
     try:
         return execute_with_retry(transaction)
@@ -147,8 +231,7 @@ def view_cart(thread_id: str = "guest_user"):
     logger.info("view_cart: thread=%s", thread_id)
 
     def transaction():
-        session = SessionLocal()
-        try:
+        with txn() as session:
             order = session.query(Order).filter(
                 Order.customer_id == thread_id,
                 Order.status == "pending_payment",
@@ -169,9 +252,6 @@ def view_cart(thread_id: str = "guest_user"):
             lines.append(f"  Estimated delivery: {_next_delivery_date(4)}")
             return "\n".join(lines)
 
-        finally:
-            session.close()
-
     try:
         return execute_with_retry(transaction)
     except Exception as e:
@@ -184,8 +264,7 @@ def remove_from_cart(product_name: str, thread_id: str = "guest_user"):
     logger.info("remove_from_cart: product=%s thread=%s", product_name, thread_id)
 
     def transaction():
-        session = SessionLocal()
-        try:
+        with txn() as session:
             order = session.query(Order).filter(
                 Order.customer_id == thread_id,
                 Order.status == "pending_payment",
@@ -204,8 +283,17 @@ def remove_from_cart(product_name: str, thread_id: str = "guest_user"):
 
             removed_total = item.price_at_purchase * item.quantity
             session.delete(item)
-            order.total_amount = max(0.0, order.total_amount - removed_total)
-            session.commit()
+            # Decrement in SQL (floored at 0) rather than read-modify-write
+            session.execute(
+                update(Order)
+                .where(Order.order_id == order.order_id)
+                .values(total_amount=case(
+                    (Order.total_amount > removed_total, Order.total_amount - removed_total),
+                    else_=0.0,
+                ))
+                .execution_options(synchronize_session=False)
+            )
+            session.flush()
             session.refresh(order)
 
             if not order.items:
@@ -222,12 +310,6 @@ def remove_from_cart(product_name: str, thread_id: str = "guest_user"):
             lines.append(f"  Total: LKR {order.total_amount:,.0f}")
             return "\n".join(lines)
 
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-
     try:
         return execute_with_retry(transaction)
     except Exception as e:
@@ -252,8 +334,16 @@ def confirm_order_details(
     phone = str(phone)
 
     def transaction():
-        session = SessionLocal()
-        try:
+        with txn() as session:
+            # Look the order up first: returning early must not commit
+            # half-applied customer details.
+            order = session.query(Order).filter(
+                Order.customer_id == thread_id,
+                Order.status == "pending_payment",
+            ).first()
+            if not order:
+                return "Error: No pending order found. Did you add items first?"
+
             customer = session.query(Customer).filter(
                 Customer.customer_id == thread_id
             ).first()
@@ -266,13 +356,6 @@ def confirm_order_details(
             customer.shipping_address = address
             customer.phone_number = phone
 
-            order = session.query(Order).filter(
-                Order.customer_id == thread_id,
-                Order.status == "pending_payment",
-            ).first()
-            if not order:
-                return "Error: No pending order found. Did you add items first?"
-
             order_number = _generate_order_number()
             order.order_number = order_number
             order.status = "confirmed"
@@ -311,15 +394,8 @@ def confirm_order_details(
                 ),
             }
 
-            session.commit()
             return json.dumps(receipt)
 
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-
     try:
         return execute_with_retry(transaction)
     except Exception as e:
@@ -335,8 +411,7 @@ def get_order_status(order_number: str = "", thread_id: str = "guest_user"):
     logger.info("get_order_status: order_number=%s thread=%s", order_number, thread_id)
 
     def transaction():
-        session = SessionLocal()
-        try:
+        with txn() as session:
             if order_number:
                 order = session.query(Order).filter(
                     Order.order_number == order_number.strip().upper()
@@ -371,9 +446,6 @@ def get_order_status(order_number: str = "", thread_id: str = "guest_user"):
                 f"  Expected delivery: {delivery}"
             )
 
-        finally:
-            session.close()
-
     try:
         return execute_with_retry(transaction)
     except Exception as e:
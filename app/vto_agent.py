@@ -20,13 +20,15 @@ import os
 import random
 import time
 import uuid
+from contextlib import nullcontext
 from datetime import date
+from functools import lru_cache
 from typing import Optional
 
 import httpx
-import requests
 import replicate
 from dotenv import load_dotenv
+from sqlalchemy import case, func, or_, update
 
 from app.database import SessionLocal
 from app.models import Product, VtoSession
@@ -177,9 +179,10 @@ def set_job_status(
     if r:
         try:
             r.setex(_job_key(job_id), JOB_TTL, payload)
+            return
         except Exception:
             pass
-    _IN_MEMORY_JOBS[job_id] = payload
+    _remember_job(job_id, payload)
 
 
 def get_job_status(job_id: str) -> dict:
@@ -192,7 +195,7 @@ def get_job_status(job_id: str) -> dict:
         except Exception:
             pass
     if raw is None:
-        raw = _IN_MEMORY_JOBS.get(job_id)
+        _, raw = _IN_MEMORY_JOBS.get(job_id, (0.0, None))
     if raw:
         data = json.loads(raw)
         started = data.get("started_at", time.time())
@@ -215,7 +218,20 @@ def get_job_status(job_id: str) -> dict:
     }
 
 
-_IN_MEMORY_JOBS: dict[str, str] = {}
+# Fallback when Redis is down: job_id -> (expires_at, payload), kept in
+# last-write order so expired jobs can be dropped from the front.
+_IN_MEMORY_JOBS: dict[str, tuple[float, str]] = {}
+
+
+def _remember_job(job_id: str, payload: str) -> None:
+    now = time.time()
+    _IN_MEMORY_JOBS.pop(job_id, None)
+    _IN_MEMORY_JOBS[job_id] = (now + JOB_TTL, payload)
+    while True:
+        oldest = next(iter(_IN_MEMORY_JOBS))
+        if _IN_MEMORY_JOBS[oldest][0] > now:
+            break
+        del _IN_MEMORY_JOBS[oldest]
 
 
 # ---------------------------------------------------------------------------
@@ -231,60 +247,76 @@ def get_or_create_session(db, thread_id: str) -> VtoSession:
 
 
 def check_and_increment_limit(db, thread_id: str, daily_limit: int = DAILY_LIMIT) -> bool:
+    """Count one try-on against today's quota; False once the limit is hit.
+
+    One conditional UPDATE resets the counter on a new day and refuses at the
+    limit, so concurrent workers can't both read N-1 and slip past it.
+    """
     today = str(date.today())
-    vto = get_or_create_session(db, thread_id)
-    if vto.usage_date != today:
-        vto.usage_date = today
-        vto.usage_count = 0
-    if vto.usage_count >= daily_limit:
-        return False
-    vto.usage_count += 1
-    db.flush()
-    return True
+    get_or_create_session(db, thread_id)
+    new_day = or_(VtoSession.usage_date.is_(None), VtoSession.usage_date != today)
+    used = func.coalesce(VtoSession.usage_count, 0)
+    result = db.execute(
+        update(VtoSession)
+        .where(VtoSession.thread_id == thread_id)
+        .where(or_(new_day, used < daily_limit))
+        .values(
+            usage_count=case((new_day, 1), else_=used + 1),
+            usage_date=today,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
 
 
-def get_product_from_db(product_query: str) -> Optional[dict]:
-    db = SessionLocal()
-    try:
+@lru_cache(maxsize=512)
+def _lookup(q_norm: str) -> Optional[tuple[str, str, str]]:
+    """(name, first image url, category) for the best match, or None.
+
+    Cached per normalised query — users repeat the same product name across
+    turns. Admin product writes and Excel imports call _lookup.cache_clear().
+    """
+    # Exact name beats a prefix match, which beats a bare substring hit, so
+    # "Bloom" picks "Bloom" over "Wild Bloom Whisper" in a single round-trip.
+    rank = case(
+        (func.lower(Product.product_name) == q_norm, 0),
+        (Product.product_name.ilike(f"{q_norm}%"), 1),
+        else_=2,
+    )
+    with SessionLocal() as db:
         product = (
             db.query(Product)
-            .filter(Product.product_name.ilike(f"%{product_query}%"))
+            .filter(Product.product_name.ilike(f"%{q_norm}%"))
+            .order_by(rank, Product.product_id)
             .first()
         )
         if product and product.image_url:
             urls = [u.strip() for u in product.image_url.split(",") if u.strip()]
-            return {
-                "name": product.product_name,
-                "url": urls[0],
-                "category": product.category or "",
-            }
+            if urls:
+                return product.product_name, _public_image_url(urls[0]), product.category or ""
+    return None
+
+
+def get_product_from_db(product_query: str) -> Optional[dict]:
+    try:
+        hit = _lookup(product_query.lower().strip())
     except Exception as e:
         logger.error("DB Error in VTO: %s", e)
-    finally:
-        db.close()
-    return None
+        return None
+    if hit is None:
+        return None
+    name, url, category = hit
+    return {"name": name, "url": url, "category": category}
 
 
 # ---------------------------------------------------------------------------
 # Image helpers
 # ---------------------------------------------------------------------------
-def download_image_temp(url: str, tag: str) -> Optional[str]:
-    temp_path = f"temp_{tag}.jpg"
+def _public_image_url(url: str) -> str:
+    """Map a legacy localhost/relative product image onto its Cloudinary URL."""
     if "localhost" in url or not url.startswith("http"):
-        url = f"{CLOUDINARY_BASE_URL}{os.path.basename(url)}"
-    if not _is_trusted_vto_url(url):
-        logger.warning("Blocked download from untrusted domain: %s", url)
-        return None
-    try:
-        r = requests.get(url, stream=True, timeout=15)
-        if r.status_code == 200:
-            with open(temp_path, "wb") as f:
-                f.write(r.content)
-            return temp_path
-        logger.warning("Image download failed: %s → %d", url, r.status_code)
-    except Exception as e:
-        logger.error("Image download error: %s", e)
-    return None
+        return f"{CLOUDINARY_BASE_URL}{os.path.basename(url)}"
+    return url
 
 
 # ---------------------------------------------------------------------------
@@ -386,38 +418,45 @@ def _extract_replicate_url(output) -> Optional[str]:
     return url if url.startswith("http") else None
 
 
-def run_replicate_vto_sync(
-    user_image_path: str,
-    product_image_path: str,
+async def run_replicate_vto(
+    user_image: str,
+    garment_image_url: str,
     product_name: str,
     product_category: str,
 ) -> Optional[str]:
     """
     IDM-VTON via Replicate. No pinned version — uses latest.
+    Both images go in as public URLs for Replicate to fetch; user_image may
+    also be a local path, which the SDK then uploads.
     Retries once on rate-limit (Replicate resets burst in ~10s for low-credit accounts).
-    Run via asyncio.to_thread so the blocking sleep doesn't stall the event loop.
+    Uses the SDK's async client so the 10–30s generation awaits on the event
+    loop instead of pinning a thread-pool worker.
     """
     idm_category = REPLICATE_CATEGORY_MAP.get(product_category, "dresses")
 
     for attempt in range(2):
         try:
-            output = replicate.run(
-                "cuuupid/idm-vton",
-                input={
-                    "garm_img":    open(product_image_path, "rb"),
-                    "human_img":   open(user_image_path, "rb"),
-                    "garment_des": product_name,
-                    "category":    idm_category,
-                    "crop":        False,
-                    "seed":        random.randint(1, 9999),
-                },
+            human_src = (
+                nullcontext(user_image) if user_image.startswith("http") else open(user_image, "rb")
             )
+            with human_src as human:
+                output = await replicate.async_run(
+                    "cuuupid/idm-vton",
+                    input={
+                        "garm_img":    garment_image_url,
+                        "human_img":   human,
+                        "garment_des": product_name,
+                        "category":    idm_category,
+                        "crop":        False,
+                        "seed":        random.randint(1, 9999),
+                    },
+                )
             return _extract_replicate_url(output)
         except Exception as e:
             err = str(e).lower()
             if ("throttled" in err or "rate limit" in err) and attempt == 0:
                 logger.warning("Replicate rate-limited — waiting 12s before retry")
-                time.sleep(12)
+                await asyncio.sleep(12)
                 continue
             logger.error("Replicate VTO error: %s", e)
             return None
@@ -454,33 +493,36 @@ async def process_vto_job(
 
     result_url: Optional[str] = None
     provider_used = "unknown"
+    garment_url = _public_image_url(product_image_url)
+    user_image_url = ""
 
     # Primary: Fashn.ai (needs publicly accessible URLs — upload user image if local)
     if os.path.exists(user_image_path):
         try:
             import cloudinary.uploader  # type: ignore
-            upload = cloudinary.uploader.upload(user_image_path, folder="pamorya_vto_users")
+            upload = await asyncio.to_thread(
+                cloudinary.uploader.upload, user_image_path, folder="pamorya_vto_users",
+            )
             user_image_url = upload.get("secure_url", "")
             if user_image_url:
-                result_url = await run_fashn_vto(user_image_url, product_image_url, product_category)
+                result_url = await run_fashn_vto(user_image_url, garment_url, product_category)
                 if result_url:
                     provider_used = "fashn.ai"
         except Exception as e:
             logger.warning("Fashn.ai path (Cloudinary upload) failed: %s — trying Replicate", e)
 
-    # Fallback: Replicate (accepts local file handles)
+    # Fallback: Replicate (fetches public URLs itself)
     if not result_url:
         logger.info("Falling back to Replicate VTO")
-        local_product = download_image_temp(product_image_url, "prod")
-        if local_product:
-            result_url = await asyncio.to_thread(
-                run_replicate_vto_sync,
-                user_image_path, local_product, product_name, product_category,
+        if _is_trusted_vto_url(garment_url):
+            # Reuse the Cloudinary copy from the Fashn.ai attempt when we have one
+            result_url = await run_replicate_vto(
+                user_image_url or user_image_path, garment_url, product_name, product_category,
             )
-            if local_product and os.path.exists(local_product):
-                os.remove(local_product)
             if result_url:
                 provider_used = "replicate"
+        else:
+            logger.warning("Blocked garment image from untrusted domain: %s", garment_url)
 
     if result_url:
         _cache_result(thread_id, product_name, result_url)
@@ -492,14 +534,14 @@ async def process_vto_job(
 
 
 # ---------------------------------------------------------------------------
-# Synchronous entry point (used by /chat and WhatsApp webhook)
+# Chat entry point (used by /chat and WhatsApp webhook)
 # ---------------------------------------------------------------------------
-def handle_vto_message(thread_id: str, user_text: str, image_path: Optional[str] = None) -> str:
+def _advance_vto_session(
+    thread_id: str, user_text: str, image_path: Optional[str]
+) -> tuple[str, Optional[dict]]:
     """
-    Stateful VTO flow called by the /chat endpoint.
-    Returns a user-facing string at each step.
-    For Step 3 (generation), returns an immediate job-queued message and
-    starts the async worker in the background.
+    Blocking (DB) half of handle_vto_message. Returns the reply and, when a
+    generation should start, the process_vto_job kwargs for it.
     """
     db = SessionLocal()
     try:
@@ -510,7 +552,7 @@ def handle_vto_message(thread_id: str, user_text: str, image_path: Optional[str]
             vto.user_image = image_path
             db.commit()
             if not user_text or len(user_text.strip()) < 2:
-                return STEP2_GUIDANCE
+                return STEP2_GUIDANCE, None
 
         # Resolve product from text
         product_data = None
@@ -523,7 +565,7 @@ def handle_vto_message(thread_id: str, user_text: str, image_path: Optional[str]
 
         # Guard: need photo
         if not vto.user_image:
-            return STEP1_GUIDANCE
+            return STEP1_GUIDANCE, None
 
         # Guard: need product
         if not vto.product_image:
@@ -531,8 +573,8 @@ def handle_vto_message(thread_id: str, user_text: str, image_path: Optional[str]
                 return (
                     f"I couldn't find **\"{user_text}\"** in our catalogue.\n"
                     "Please try another product name, e.g. \"Crimson Canvas\" or \"Wild Bloom Whisper\"."
-                )
-            return STEP2_GUIDANCE
+                ), None
+            return STEP2_GUIDANCE, None
 
         # Check cache before counting against limit
         cached = _get_cached_result(thread_id, vto.product_name)
@@ -542,7 +584,7 @@ def handle_vto_message(thread_id: str, user_text: str, image_path: Optional[str]
                 f'<img src="{cached}" alt="Virtual Try-On: {vto.product_name}" '
                 f'style="max-width:100%;border-radius:8px;" />\n\n'
                 "Want to try another style? Just tell me another product name."
-            )
+            ), None
 
         # Daily limit check
         if not check_and_increment_limit(db, thread_id, DAILY_LIMIT):
@@ -550,43 +592,57 @@ def handle_vto_message(thread_id: str, user_text: str, image_path: Optional[str]
             return (
                 f"You've reached today's limit of {DAILY_LIMIT} try-ons. "
                 "Come back tomorrow! 😊"
-            )
+            ), None
         db.commit()
 
-        # Launch async job
+        # Launch async job (started by the caller, on the event loop)
         job_id = str(uuid.uuid4())
         set_job_status(job_id, "queued")
-
-        task = asyncio.create_task(
-            process_vto_job(
-                job_id=job_id,
-                thread_id=thread_id,
-                user_image_path=vto.user_image,
-                product_image_url=vto.product_image,
-                product_name=vto.product_name,
-                product_category=product_data["category"] if product_data else vto.product_name,
-            )
+        job = dict(
+            job_id=job_id,
+            thread_id=thread_id,
+            user_image_path=vto.user_image,
+            product_image_url=vto.product_image,
+            product_name=vto.product_name,
+            product_category=product_data["category"] if product_data else vto.product_name,
         )
 
-        def _vto_task_done(t: asyncio.Task) -> None:
-            if not t.cancelled() and t.exception():
-                logger.error(
-                    "VTO background task failed (job_id=%s): %s", job_id, t.exception()
-                )
-                set_job_status(job_id, "failed", error=str(t.exception()))
-
-        task.add_done_callback(_vto_task_done)
-
         return (
             f"✨ Generating your look with **{vto.product_name}**!\n\n"
             f"This takes about 20–30 seconds. Your job ID is: `{job_id}`\n\n"
             "You can check the status with the **Check Try-On** button, "
             "or I'll show you the result as soon as it's ready."
-        )
+        ), job
 
     except Exception as e:
         db.rollback()
         logger.error("VTO Handler Error: %s", e)
-        return "Something went wrong with the try-on. Please try again."
+        return "Something went wrong with the try-on. Please try again.", None
     finally:
         db.close()
+
+
+async def handle_vto_message(thread_id: str, user_text: str, image_path: Optional[str] = None) -> str:
+    """
+    Stateful VTO flow called by the /chat endpoint.
+    Returns a user-facing string at each step.
+    For Step 3 (generation), returns an immediate job-queued message and
+    starts the async worker in the background.
+    """
+    # Session reads/writes are blocking DB calls — keep them off the event loop
+    reply, job = await asyncio.to_thread(_advance_vto_session, thread_id, user_text, image_path)
+    if job is None:
+        return reply
+
+    job_id = job["job_id"]
+    task = asyncio.create_task(process_vto_job(**job))
+
+    def _vto_task_done(t: asyncio.Task) -> None:
+        if not t.cancelled() and t.exception():
+            logger.error(
+                "VTO background task failed (job_id=%s): %s", job_id, t.exception()
+            )
+            set_job_status(job_id, "failed", error=str(t.exception()))
+
+    task.add_done_callback(_vto_task_done)
+    return reply
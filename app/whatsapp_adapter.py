@@ -74,34 +74,40 @@ async def download_whatsapp_image(media_url: str) -> Optional[str]:
     if not media_url:
         return None
 
+    file_path = None
     try:
         async with httpx.AsyncClient() as client:
-            resp = await client.get(
+            # Stream to disk in 1 MiB chunks rather than holding the whole photo in memory
+            async with client.stream(
+                "GET",
                 media_url,
                 auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
                 follow_redirects=True,
                 timeout=30,
-            )
-            if resp.status_code != 200:
-                print(f"⚠️ WhatsApp media download failed: {resp.status_code}")
-                return None
-
-            ext = "jpg"
-            content_type = resp.headers.get("content-type", "")
-            if "png" in content_type:
-                ext = "png"
-            elif "webp" in content_type:
-                ext = "webp"
-
-            os.makedirs("uploaded_images", exist_ok=True)
-            filename  = f"{uuid.uuid4()}.{ext}"
-            file_path = os.path.join("uploaded_images", filename)
-            with open(file_path, "wb") as f:
-                f.write(resp.content)
-            return file_path
+            ) as resp:
+                if resp.status_code != 200:
+                    print(f"⚠️ WhatsApp media download failed: {resp.status_code}")
+                    return None
+
+                ext = "jpg"
+                content_type = resp.headers.get("content-type", "")
+                if "png" in content_type:
+                    ext = "png"
+                elif "webp" in content_type:
+                    ext = "webp"
+
+                os.makedirs("uploaded_images", exist_ok=True)
+                filename  = f"{uuid.uuid4()}.{ext}"
+                file_path = os.path.join("uploaded_images", filename)
+                with open(file_path, "wb") as f:
+                    async for chunk in resp.aiter_bytes(1 << 20):
+                        f.write(chunk)
+                return file_path
 
     except Exception as exc:
         print(f"⚠️ WhatsApp media download error: {exc}")
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
         return None
 
 
@@ -1,10 +1,25 @@
+import json
 import os
+import sys
 import pandas as pd
 import cloudinary
 import cloudinary.api
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+# Same engine choice as app/db_builder.py: calamine when installed
+try:
+    import python_calamine  # type: ignore  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+try:
+    import xlsxwriter  # type: ignore
+except ImportError:
+    xlsxwriter = None
+
 load_dotenv()
 
 # --- CONFIGURATION ---
@@ -15,33 +30,127 @@ cloudinary.config(
     api_secret=os.getenv("CLOUDINARY_API_SECRET")
 )
 
+FETCH_WORKERS = 8
+
 INPUT_EXCEL = "Pamorya_Stock(1).xlsx"
 # We overwrite the file so the DB builder sees the changes
 OUTPUT_EXCEL = "Pamorya_Stock(2).xlsx"
+# Last full Cloudinary listing; later runs only fetch images created since
+RESOURCE_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "cloudinary_resources.json")
 
 
 def clean_column_name(col_name):
     return re.sub(r'\s+', ' ', str(col_name)).strip()
 
 
-def fetch_every_image():
-    print("--- 1. Scanning ENTIRE Cloudinary Account... ---")
-    all_resources = []
+# Characters that may follow a dress code in a filename
+# ("pwbw01" matches "pwbw01_v2" but not "pwbw015")
+_CODE_BOUNDARY = re.compile(r'[_\-. ]')
+
+
+def link_codes(clean_name):
+    """Every dress code this filename links to: the name cut before each
+    boundary character, plus the whole name ("pwbw01_v1" -> pwbw01, pwbw01_v1)."""
+    cuts = [clean_name[:m.start()] for m in _CODE_BOUNDARY.finditer(clean_name) if m.start()]
+    return cuts + [clean_name]
+
+
+def write_excel(df, path):
+    """Write `df` like df.to_excel(path, index=False), streaming rows out with
+    xlsxwriter's constant_memory mode when it's installed. pandas' own
+    xlsxwriter path can't be used for this: it writes column by column, and
+    constant_memory drops any row it has already moved past."""
+    if xlsxwriter is None:
+        df.to_excel(path, index=False)
+        return
+    workbook = xlsxwriter.Workbook(path, {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd",
+        # write_row() would otherwise turn text into hyperlinks (dropping
+        # cells over Excel's 2079-char URL limit) and "=..." into formulas
+        "strings_to_urls": False,
+        "strings_to_formulas": False,
+    })
+    try:
+        sheet = workbook.add_worksheet()
+        sheet.write_row(0, 0, [str(c) for c in df.columns])
+        cells = df.astype(object).where(df.notna(), None)
+        for row_idx, row in enumerate(cells.itertuples(index=False, name=None), start=1):
+            sheet.write_row(row_idx, 0, row)
+    finally:
+        workbook.close()
+
+
+def _fetch_pages(prefix=None, start_at=None):
+    """Follow the Admin API cursor chain for one prefix (or the whole account),
+    optionally only for images created since `start_at`."""
+    filters = {k: v for k, v in (("prefix", prefix), ("start_at", start_at)) if v}
+    resources = []
     next_cursor = None
+    while True:
+        response = cloudinary.api.resources(
+            type="upload",
+            max_results=500,
+            next_cursor=next_cursor,
+            **filters,
+        )
+        batch = response.get('resources', [])
+        resources.extend(batch)
+        print(f"   -> Fetched batch of {len(batch)} from {prefix or 'account'}... (Total: {len(resources)})")
+        if 'next_cursor' in response:
+            next_cursor = response['next_cursor']
+        else:
+            return resources
+
+
+def _load_resource_cache():
+    try:
+        with open(RESOURCE_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _save_resource_cache(resources):
+    try:
+        os.makedirs(os.path.dirname(RESOURCE_CACHE), exist_ok=True)
+        with open(RESOURCE_CACHE, "w") as f:
+            json.dump([{k: r.get(k) for k in ("public_id", "secure_url", "created_at")} for r in resources], f)
+    except OSError as e:
+        print(f"⚠️ Cloudinary listing not cached: {e}")
+
+
+def _fetch_account(full=False):
+    """Whole-account listing: cached from the last run plus anything created
+    since. The Admin API can't filter a prefix scan by date, so only this
+    path is incremental; --full rescans (e.g. after deleting images)."""
+    cached = [] if full else _load_resource_cache()
+    since = max((r.get("created_at") or "" for r in cached), default="")
+    if not since:
+        resources = _fetch_pages()
+    else:
+        print(f"   -> {len(cached)} images cached; fetching those created since {since}")
+        merged = {r["public_id"]: r for r in cached}
+        merged.update((r["public_id"], r) for r in _fetch_pages(start_at=since))
+        resources = list(merged.values())
+    _save_resource_cache(resources)
+    return resources
+
+
+def fetch_every_image(full=False):
+    # Cursor pages can't be fetched out of order, but separate folders are
+    # independent chains. With CLOUDINARY_PRODUCT_FOLDERS set we page those
+    # concurrently (and skip unrelated uploads such as VTO user photos);
+    # otherwise scan the whole account as before.
+    folders = [f.strip().strip("/") for f in os.getenv("CLOUDINARY_PRODUCT_FOLDERS", "").split(",") if f.strip()]
+    print(f"--- 1. Scanning {', '.join(folders) if folders else 'ENTIRE Cloudinary Account'}... ---")
     try:
-        while True:
-            response = cloudinary.api.resources(
-                type="upload",
-                max_results=500,
-                next_cursor=next_cursor
-            )
-            batch = response.get('resources', [])
-            all_resources.extend(batch)
-            print(f"   -> Fetched batch of {len(batch)}... (Total: {len(all_resources)})")
-            if 'next_cursor' in response:
-                next_cursor = response['next_cursor']
-            else:
-                break
+        if folders:
+            with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(folders))) as pool:
+                pages = pool.map(_fetch_pages, [f"{f}/" for f in folders])
+                all_resources = [res for page in pages for res in page]
+        else:
+            all_resources = _fetch_account(full)
     except Exception as e:
         print(f"❌ Cloudinary Connection Error: {e}")
         print("   (Check your CLOUDINARY_API_KEY and SECRET in .env)")
@@ -51,21 +160,26 @@ def fetch_every_image():
     return all_resources
 
 
-def auto_link_images():
+def auto_link_images(full=False):
     # 1. Fetch Cloudinary Data
-    resources = fetch_every_image()
+    resources = fetch_every_image(full)
     if not resources:
         return
 
-    # 2. Map Clean Filenames -> URLs
-    image_list = []
-    for res in resources:
-        full_id = res['public_id']
-        filename = full_id.split('/')[-1].lower()  # e.g. "pwbw01_v1"
-        image_list.append({
-            "clean_name": filename,
-            "url": res['secure_url']
-        })
+    # 2. Index clean filenames by every code they can match, once
+    # Arrow-backed strings: the basename/lowercase pass runs in Arrow's compute
+    # kernels (rsplit().str[-1] would drop back to Python objects)
+    public_ids = pd.Series([res['public_id'] for res in resources], dtype="string[pyarrow]")
+    img_df = pd.DataFrame({
+        "clean_name": public_ids.str.replace(r'^.*/', '', regex=True).str.lower(),  # e.g. "pwbw01_v1"
+        "url": [res['secure_url'] for res in resources],
+    })
+    img_df["code"] = img_df["clean_name"].map(link_codes)
+    links = (
+        img_df.explode("code")
+        .groupby("code")["url"]
+        .agg(lambda urls: sorted(set(urls)))
+    )
 
     # 3. Process Excel (Handle Double Headers)
     print("\n--- 2. Processing Excel... ---")
@@ -75,7 +189,7 @@ def auto_link_images():
         if not os.path.exists(excel_path):
             excel_path = INPUT_EXCEL  # Try relative
 
-        df_raw = pd.read_excel(excel_path, header=None)
+        df_raw = pd.read_excel(excel_path, header=None, engine=EXCEL_ENGINE)
     except Exception as e:
         print(f"❌ Cannot read Excel: {e}")
         return
@@ -102,42 +216,24 @@ def auto_link_images():
             col_map[col] = "image_url"
     df.rename(columns=col_map, inplace=True)
 
-    if 'image_url' not in df.columns:
-        df['image_url'] = ""
-
-    count = 0
     print("\n--- 3. Matching Products ---")
-
-    for index, row in df.iterrows():
-        raw_code = str(row.get('Dress Code', ''))
-        if raw_code == 'nan' or not raw_code.strip():
-            continue
-
-        code = raw_code.strip().lower()
-
-        # FIND MATCHES (Starts with Code)
-        matched_urls = []
-        for img in image_list:
-            # Match "pwbw01" against "pwbw01", "pwbw01_01", "pwbw01_v2"
-            if img['clean_name'].startswith(code):
-                remainder = img['clean_name'][len(code):]
-                # Ensure boundary (pwbw01 should not match pwbw015)
-                if not remainder or remainder[0] in ['_', '-', '.', ' ']:
-                    matched_urls.append(img['url'])
-
-        if matched_urls:
-            unique_urls = sorted(list(set(matched_urls)))
-            final_str = ",".join(unique_urls)
-            # Write back to specific column
-            df.at[index, 'image_url'] = final_str
-            count += 1
-            print(f"✅ {code.upper()}: Linked {len(unique_urls)} images.")
+    raw_codes = df.get('Dress Code', pd.Series('', index=df.index)).astype(str)
+    codes = raw_codes.str.strip().str.lower()
+    matched = codes.map(links)  # NaN where no image matches
+    hit = matched.notna() & raw_codes.ne('nan') & raw_codes.str.strip().ne('')
+
+    # One column assignment; rows without a match keep their existing image
+    existing = df['image_url'] if 'image_url' in df.columns else ""
+    df['image_url'] = matched.str.join(",").where(hit, existing).astype("string")
+    for code, urls in zip(codes[hit], matched[hit]):
+        print(f"✅ {code.upper()}: Linked {len(urls)} images.")
+    count = int(hit.sum())
 
     # 4. Save (We construct a new DataFrame to preserve headers?)
     # Actually, simpler to just save this cleaned version for the DB builder
-    df.to_excel(excel_path, index=False)
+    write_excel(df, excel_path)
     print(f"\n🎉 SUCCESS: Updated {count} products in '{excel_path}'")
 
 
 if __name__ == "__main__":
-    auto_link_images()
\ No newline at end of file
+    auto_link_images(full="--full" in sys.argv[1:])
\ No newline at end of file
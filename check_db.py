@@ -2,6 +2,8 @@
 import sqlite3
 import os
 
+import pandas as pd
+
 DB_PATH = os.path.join(os.path.dirname(__file__), "apparel.db")
 
 print(f"--- Checking database at: {DB_PATH} ---")
@@ -12,21 +14,24 @@ try:
 
     print("\n--- Checking 'products' table for Image URLs ---")
 
-    # Select only the product name and its image URL
-    cursor.execute("SELECT product_name, image_url FROM products")
+    # Select only the product name and its image URL, streamed in chunks so
+    # a large table is never held in memory at once
+    chunks = pd.read_sql_query("SELECT product_name, image_url FROM products", conn, chunksize=10_000)
 
-    products = cursor.fetchall()
+    total = 0
+    for chunk in chunks:
+        if not total:
+            print("Displaying (Name, Image_URL):")
+            print("--------------------------------------------------")
+        print(chunk.to_string(index=False, header=False, na_rep="None"))
+        total += len(chunk)
 
-    if not products:
+    if not total:
         print("!!! ERROR: The 'products' table is EMPTY. !!!")
         print("The db_builder.py script did not load the CSV data.")
     else:
-        print(f"SUCCESS: Found {len(products)} products. Displaying (Name, Image_URL):")
         print("--------------------------------------------------")
-        for product in products:
-            print(f"- Name: {product[0]}")
-            print(f"  URL: {product[1]}")  # product[1] is the image_url
-            print("---")
+        print(f"SUCCESS: Found {total} products.")
 
     conn.close()
 
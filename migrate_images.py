@@ -1,5 +1,6 @@
 import os
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 import cloudinary
 import cloudinary.uploader
 from dotenv import load_dotenv
@@ -18,12 +19,50 @@ cloudinary.config(
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "apparel.db")
 IMAGES_DIR = os.path.join(BASE_DIR, "product_images")
+UPLOAD_WORKERS = 16
+
+
+def upload_product_image(product):
+    """Upload one product's local image; returns (cloud_url, product_id) or None."""
+    p_id, p_name, local_url = product
+
+    # Extract filename (e.g., "http://localhost:8000/.../PWBW01.jpg" -> "PWBW01.jpg")
+    filename = os.path.basename(local_url)
+    local_file_path = os.path.join(IMAGES_DIR, filename)
+
+    if not os.path.exists(local_file_path):
+        print(f"⚠️ Warning: File not found for {p_name} ({filename}). Skipping.")
+        return None
+
+    try:
+        print(f"Uploading {filename} to Cloudinary...")
+
+        # Upload to Cloudinary
+        # use_filename=True keeps the original name (PWBW01)
+        # unique_filename=False prevents it from adding random characters (PWBW01_abc123)
+        response = cloudinary.uploader.upload(
+            local_file_path,
+            use_filename=True,
+            unique_filename=False,
+            folder="apparel_bot_products"
+        )
+
+        cloud_url = response['secure_url']
+        print(f"   ✅ Success! New URL: {cloud_url}")
+        return cloud_url, p_id
+
+    except Exception as e:
+        print(f"   ❌ Error uploading {filename}: {e}")
+        return None
 
 
 def migrate_images():
     print("--- Starting Cloud Image Migration ---")
 
     conn = sqlite3.connect(DB_PATH)
+    # Same journal settings the app's engine uses (app/database.py)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     cursor = conn.cursor()
 
     # Get all products that still have "localhost" in their URL
@@ -32,49 +71,20 @@ def migrate_images():
 
     if not products:
         print("No products need migration! (All seem to be cloud links already)")
+        conn.close()
         return
 
     print(f"Found {len(products)} products to migrate...")
 
-    updated_count = 0
-
-    for product in products:
-        p_id, p_name, local_url = product
-
-        # Extract filename (e.g., "http://localhost:8000/.../PWBW01.jpg" -> "PWBW01.jpg")
-        filename = os.path.basename(local_url)
-        local_file_path = os.path.join(IMAGES_DIR, filename)
-
-        if not os.path.exists(local_file_path):
-            print(f"⚠️ Warning: File not found for {p_name} ({filename}). Skipping.")
-            continue
-
-        try:
-            print(f"Uploading {filename} to Cloudinary...")
-
-            # Upload to Cloudinary
-            # use_filename=True keeps the original name (PWBW01)
-            # unique_filename=False prevents it from adding random characters (PWBW01_abc123)
-            response = cloudinary.uploader.upload(
-                local_file_path,
-                use_filename=True,
-                unique_filename=False,
-                folder="apparel_bot_products"
-            )
-
-            cloud_url = response['secure_url']
-
-            # Update Database
-            cursor.execute("UPDATE products SET image_url = ? WHERE product_id = ?", (cloud_url, p_id))
-            updated_count += 1
-            print(f"   ✅ Success! New URL: {cloud_url}")
-
-        except Exception as e:
-            print(f"   ❌ Error uploading {filename}: {e}")
+    # Uploads are independent network round-trips — run them side by side,
+    # then write every new URL in one statement and one commit.
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+        updates = [u for u in pool.map(upload_product_image, products) if u]
 
+    cursor.executemany("UPDATE products SET image_url = ? WHERE product_id = ?", updates)
     conn.commit()
     conn.close()
-    print(f"--- Migration Complete. Updated {updated_count} products. ---")
+    print(f"--- Migration Complete. Updated {len(updates)} products. ---")
 
 
 if __name__ == "__main__":
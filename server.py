@@ -3,21 +3,21 @@ import json
 import logging
 import os
 import re
-import shutil
 import time
-import traceback
 import uuid
 from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI, File, Form, Query, Request, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from pydantic import BaseModel
+from starlette.formparsers import MultiPartParser
 
-from app.observability import configure_langsmith
+from app.observability import configure_langsmith, start_queued_logging, stop_queued_logging
 
 # --- DB IMPORTS ---
 from app.db_builder import init_db, populate_initial_data
@@ -57,6 +57,11 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 # SECURITY: Allowed file types and max size (5 MB)
 ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "avif"}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
+# Leading bytes of each accepted format (AVIF's "ftyp" box sits at offset 4)
+_IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n")
+# Whole multipart body: the image plus form fields and part headers
+MAX_UPLOAD_BODY = MAX_FILE_SIZE + 64 * 1024
+UPLOAD_PATHS = {"/chat", "/vto/start"}
 
 # Input guardrails
 MAX_QUERY_LENGTH = 2_000           # characters
@@ -82,9 +87,13 @@ _INJECTION_PATTERNS = re.compile(
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global rag_agent_app
+    start_queued_logging()
+    # uvicorn's default loop="auto" picks uvloop when it's installed
+    print(f"🔁 Event loop: {type(asyncio.get_running_loop()).__module__}")
     print("🔄 Lifespan: Checking database status...")
     try:
-        init_db()
+        # create_all + ALTER migrations block on the DB; keep the loop free
+        await asyncio.to_thread(init_db)
         # populate_initial_data() removed — use POST /admin/import-excel instead
     except Exception as exc:
         print(f"❌ DB Startup Error: {exc}")
@@ -97,12 +106,81 @@ async def lifespan(app: FastAPI):
         print(f"❌ Agent Startup Error: {exc}")
     yield
     print("🛑 Shutdown: Server closing...")
+    stop_queued_logging()
+
+
+# ---------------------------------------------------------------------------
+# UPLOAD SIZE GUARD
+# ---------------------------------------------------------------------------
+_TOO_LARGE = "Image is too large (max 5 MB)."
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Plain ASGI (not @app.middleware) so it can watch the body as it arrives.
+    A declared Content-Length over the limit is refused before anything is
+    read; a body that grows past it (chunked uploads declare no length) is
+    cut off mid-stream instead of being spooled to disk in full.
+    """
+
+    def __init__(self, app, limit: int = MAX_UPLOAD_BODY, paths=frozenset(UPLOAD_PATHS)):
+        self.app = app
+        self.limit = limit
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        try:
+            declared = int(dict(scope["headers"]).get(b"content-length", 0))
+        except ValueError:
+            declared = 0
+        if declared > self.limit:
+            response = JSONResponse(status_code=413, content={"detail": _TOO_LARGE})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # Raised inside form parsing; FastAPI re-raises HTTPException
+                    raise HTTPException(status_code=413, detail=_TOO_LARGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that tells browsers/CDNs how long they may keep a file,
+    so repeat image views never reach this process at all."""
+
+    def __init__(self, *args, cache_control: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", self.cache_control)
+        return response
 
 
 # ---------------------------------------------------------------------------
 # INITIALIZE APP
 # ---------------------------------------------------------------------------
-limiter = Limiter(key_func=get_remote_address)
+# Counters live in Redis when it's configured, so every worker/replica shares
+# one budget per client; moving-window avoids the fixed-window edge burst.
+# If Redis drops out, limits fall back to per-process memory instead of 500s.
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=os.getenv("REDIS_URL") or "memory://",
+    strategy="moving-window",
+    in_memory_fallback_enabled=True,
+)
 
 app = FastAPI(
     title="Apparel Chatbot API",
@@ -117,17 +195,31 @@ app = FastAPI(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-app.mount("/uploaded_images", StaticFiles(directory=UPLOAD_DIR), name="images")
+app.mount(
+    "/uploaded_images",
+    CachedStaticFiles(directory=UPLOAD_DIR, cache_control="public, max-age=31536000, immutable"),
+    name="images",
+)
 os.makedirs("product_images", exist_ok=True)
-app.mount("/product_images", StaticFiles(directory="product_images"), name="products")
+app.mount(
+    "/product_images",
+    CachedStaticFiles(directory="product_images", cache_control="public, max-age=86400"),
+    name="products",
+)
 
+# Inside CORS, so a 413 still carries the CORS headers the browser needs
+app.add_middleware(UploadSizeLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origin_regex=CORS_ORIGIN_REGEX,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+    allow_headers=["Content-Type", "Authorization", "x-admin-key"],
+    max_age=86400,  # browsers reuse the preflight for a day instead of 10 min
 )
+# Added after CORS so it wraps it; SSE (text/event-stream) and images are
+# skipped by Starlette, so streaming replies still flush token by token.
+app.add_middleware(GZipMiddleware, minimum_size=512)
 
 app.include_router(admin_router)
 
@@ -186,9 +278,9 @@ async def resolve_stale_state(config: dict) -> bool:
         if not unresolved:
             return False
 
-        print(
-            f"⚠️  Stale state on thread {config['configurable']['thread_id']}: "
-            f"{len(unresolved)} unresolved tool call(s). Injecting cleanup..."
+        logger.warning(
+            "Stale state on thread %s: %d unresolved tool call(s). Injecting cleanup...",
+            config["configurable"]["thread_id"], len(unresolved),
         )
 
         cleanup_messages = [
@@ -203,12 +295,12 @@ async def resolve_stale_state(config: dict) -> bool:
         ]
 
         await rag_agent_app.aupdate_state(config, {"messages": cleanup_messages})
-        print("✅ Stale state resolved — clean handoff point established.")
+        logger.info("Stale state resolved — clean handoff point established.")
         return True
 
     except Exception as exc:
         # Non-fatal: log and continue.  A stale state is better than a crash.
-        print(f"⚠️  resolve_stale_state error (non-fatal): {exc}")
+        logger.warning("resolve_stale_state error (non-fatal): %s", exc)
         return False
 
 
@@ -233,6 +325,113 @@ def validate_query(query: str) -> str | None:
     return None
 
 
+def _upload_ext(filename: str) -> str:
+    return os.path.splitext(filename)[1][1:].lower()
+
+
+def _looks_like_image(head: bytes) -> bool:
+    """Magic-number check on the first 12 bytes, so a renamed non-image
+    is refused instead of being saved and sent on to the VTO providers."""
+    if head.startswith(_IMAGE_SIGNATURES):
+        return True
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return True
+    return head[4:12] in (b"ftypavif", b"ftypavis")
+
+
+async def _has_image_header(file: UploadFile) -> bool:
+    head = await file.read(12)
+    await file.seek(0)
+    return _looks_like_image(head)
+
+
+def _sendfile_upload(src, out, limit: int) -> bool | None:
+    """Kernel-side copy for an upload Starlette has already spooled to disk.
+    Returns None when that isn't possible and the caller should stream it."""
+    if not hasattr(os, "sendfile"):
+        return None
+    size = src.seek(0, os.SEEK_END)
+    src.seek(0)
+    # Parts up to spool_max_size stay in memory; fileno() would first copy
+    # one of those out to disk, so only bodies past it are already on disk.
+    if size <= MultiPartParser.spool_max_size:
+        return None
+    if size > limit:
+        return False
+    sent = 0
+    try:
+        src_fd = src.fileno()
+        while sent < size:
+            n = os.sendfile(out.fileno(), src_fd, sent, size - sent)
+            if n == 0:
+                break
+            sent += n
+    except OSError:
+        pass  # e.g. macOS only sends to sockets
+    if sent == size:
+        return True
+    # Short or failed copy — start over with the read loop
+    out.seek(0)
+    out.truncate()
+    return None
+
+
+def _stream_upload(src, out, limit: int) -> bool:
+    written = 0
+    while chunk := src.read(64 * 1024):
+        written += len(chunk)
+        if written > limit:
+            return False
+        out.write(chunk)
+    return True
+
+
+def _copy_upload(src, dest_path: str, limit: int) -> bool:
+    with open(dest_path, "wb") as out:
+        ok = _sendfile_upload(src, out, limit)
+        if ok is None:
+            ok = _stream_upload(src, out, limit)
+    if not ok:
+        os.remove(dest_path)
+    return ok
+
+
+async def save_upload(file: UploadFile, dest_path: str, limit: int = MAX_FILE_SIZE) -> bool:
+    """Write an upload to disk on a worker thread so a slow disk doesn't
+    stall every other request on the event loop. Stops at `limit` bytes
+    (chunked bodies carry no Content-Length) and returns False if over it."""
+    return await asyncio.to_thread(_copy_upload, file.file, dest_path, limit)
+
+
+def _content_text(raw) -> str:
+    """Text of an AIMessage/chunk content — Gemini may return a list of parts."""
+    if isinstance(raw, str):
+        return raw
+    if isinstance(raw, list):
+        return "".join(p["text"] for p in raw if isinstance(p, dict) and "text" in p)
+    return ""
+
+
+async def _run_agent(query: str, config: dict) -> str | None:
+    """Run the graph to completion and return the last non-empty AI text.
+    Shared by /chat and /whatsapp; /chat/stream relays tokens as they arrive."""
+    final_response = None
+    async for event in rag_agent_app.astream(
+        {"messages": [HumanMessage(content=query)]},
+        config=config,
+        stream_mode="values",
+    ):
+        new_messages = event.get("messages", [])
+        if not new_messages:
+            continue
+        last_message = new_messages[-1]
+        if isinstance(last_message, AIMessage) and last_message.content:
+            text_content = _content_text(last_message.content)
+            if text_content.strip():
+                final_response = text_content
+    return final_response
+
+
 # ---------------------------------------------------------------------------
 # CHAT ENDPOINT
 # ---------------------------------------------------------------------------
@@ -264,22 +463,21 @@ async def chat(
 
     # 3. SECURITY: File validation
     if file:
-        file.file.seek(0, 2)
-        size = file.file.tell()
-        file.file.seek(0)
-        if size > MAX_FILE_SIZE:
-            return OutputChat(response="Error: Image is too large (max 5 MB).", thread_id=thread_id)
-        filename = file.filename.lower()
-        ext = filename.split(".")[-1] if "." in filename else ""
+        ext = _upload_ext(file.filename)
         if ext not in ALLOWED_EXTENSIONS:
             return OutputChat(
                 response=f"Error: Invalid file type '.{ext}'. Accepted: jpg, jpeg, png, webp, avif.",
                 thread_id=thread_id,
             )
+        if not await _has_image_header(file):
+            return OutputChat(
+                response="Error: That file doesn't look like a valid image. Accepted: jpg, jpeg, png, webp, avif.",
+                thread_id=thread_id,
+            )
         safe_filename = f"{uuid.uuid4()}.{ext}"
         file_location = os.path.join(UPLOAD_DIR, safe_filename)
-        with open(file_location, "wb+") as fobj:
-            shutil.copyfileobj(file.file, fobj)
+        if not await save_upload(file, file_location):
+            return OutputChat(response="Error: Image is too large (max 5 MB).", thread_id=thread_id)
         image_path = file_location
 
     # 4. Agent logic
@@ -287,11 +485,11 @@ async def chat(
 
     try:
         if mode == "vto":
-            print(f"--- VTO MODE [Thread: {thread_id}] ---")
-            final_response = handle_vto_message(thread_id, query, image_path)
+            logger.info("VTO MODE [Thread: %s]", thread_id)
+            final_response = await handle_vto_message(thread_id, query, image_path)
 
         else:
-            print(f"--- STANDARD MODE [Thread: {thread_id}] ---")
+            logger.info("STANDARD MODE [Thread: %s]", thread_id)
             config = {"configurable": {"thread_id": thread_id}}
 
             # ----------------------------------------------------------------
@@ -304,8 +502,6 @@ async def chat(
             # ----------------------------------------------------------------
             await resolve_stale_state(config)
 
-            input_message = [HumanMessage(content=query)]
-
             # ----------------------------------------------------------------
             # FIX: asyncio.timeout caps slow runs instead of letting them hang
             # indefinitely.  A TimeoutError is caught below and surfaced as a
@@ -313,39 +509,17 @@ async def chat(
             # next time resolve_stale_state runs.
             # ----------------------------------------------------------------
             async with asyncio.timeout(AGENT_TIMEOUT_SECONDS):
-                async for event in rag_agent_app.astream(
-                    {"messages": input_message},
-                    config=config,
-                    stream_mode="values",
-                ):
-                    new_messages = event.get("messages", [])
-                    if not new_messages:
-                        continue
-                    last_message = new_messages[-1]
-
-                    if isinstance(last_message, AIMessage) and last_message.content:
-                        raw_content = last_message.content
-                        text_content = ""
-                        if isinstance(raw_content, str):
-                            text_content = raw_content
-                        elif isinstance(raw_content, list):
-                            for part in raw_content:
-                                if isinstance(part, dict) and "text" in part:
-                                    text_content += part["text"]
-
-                        if text_content.strip():
-                            final_response = text_content
+                final_response = await _run_agent(query, config)
 
     except asyncio.TimeoutError:
-        print(f"⏱️  Agent timed out after {AGENT_TIMEOUT_SECONDS}s [Thread: {thread_id}]")
+        logger.warning("Agent timed out after %ss [Thread: %s]", AGENT_TIMEOUT_SECONDS, thread_id)
         final_response = (
             "I'm taking a bit longer than usual on that one — sorry about that! "
             "Please try asking again in a moment."
         )
 
     except Exception as exc:
-        print(f"❌ INTERNAL ERROR [Thread: {thread_id}]: {exc}")
-        traceback.print_exc()
+        logger.exception("INTERNAL ERROR [Thread: %s]: %s", thread_id, exc)
         final_response = "I encountered a temporary error. Please try asking again."
 
     # 5. Fallback if no response was collected
@@ -417,11 +591,7 @@ async def chat_stream(
                         if ev == "on_chat_model_stream":
                             chunk = event.get("data", {}).get("chunk")
                             if chunk and chunk.content:
-                                raw = chunk.content
-                                text = raw if isinstance(raw, str) else "".join(
-                                    p.get("text", "") for p in raw
-                                    if isinstance(p, dict) and "text" in p
-                                )
+                                text = _content_text(chunk.content)
                                 if text:
                                     await result_queue.put(("delta", text))
                                     delta_emitted = True
@@ -435,11 +605,7 @@ async def chat_stream(
                                     (m for m in reversed(msgs) if isinstance(m, AIMessage)), None
                                 )
                                 if last_ai and last_ai.content:
-                                    raw = last_ai.content
-                                    text = raw if isinstance(raw, str) else "".join(
-                                        p.get("text", "") for p in raw
-                                        if isinstance(p, dict) and "text" in p
-                                    )
+                                    text = _content_text(last_ai.content)
                                     if text:
                                         await result_queue.put(("delta", text))
                                         delta_emitted = True
@@ -519,7 +685,7 @@ async def whatsapp_webhook(request: Request):
     media_url  = payload["media_url"]
     sender     = payload["from"]
 
-    print(f"--- WhatsApp [{thread_id}]: '{user_text}' | media={bool(media_url)} ---")
+    logger.info("WhatsApp [%s]: %r | media=%s", thread_id, user_text, bool(media_url))
 
     # Download any attached image
     image_path: str | None = None
@@ -533,44 +699,22 @@ async def whatsapp_webhook(request: Request):
         # For simplicity, treat image uploads as VTO mode; text-only as standard
         if image_path and not user_text:
             # Photo with no text → VTO photo step
-            final_response = handle_vto_message(thread_id, "", image_path)
+            final_response = await handle_vto_message(thread_id, "", image_path)
         elif image_path:
             # Photo + text → could be VTO product selection or general
-            final_response = handle_vto_message(thread_id, user_text, image_path)
+            final_response = await handle_vto_message(thread_id, user_text, image_path)
         else:
             # Standard text → LangGraph agent
             config = {"configurable": {"thread_id": thread_id}}
             await resolve_stale_state(config)
 
-            input_message = [HumanMessage(content=user_text or "Hello")]
-
             async with asyncio.timeout(AGENT_TIMEOUT_SECONDS):
-                async for event in rag_agent_app.astream(
-                    {"messages": input_message},
-                    config=config,
-                    stream_mode="values",
-                ):
-                    new_messages = event.get("messages", [])
-                    if not new_messages:
-                        continue
-                    last_message = new_messages[-1]
-                    if isinstance(last_message, AIMessage) and last_message.content:
-                        raw_content = last_message.content
-                        text_content = ""
-                        if isinstance(raw_content, str):
-                            text_content = raw_content
-                        elif isinstance(raw_content, list):
-                            for part in raw_content:
-                                if isinstance(part, dict) and "text" in part:
-                                    text_content += part["text"]
-                        if text_content.strip():
-                            final_response = text_content
+                final_response = await _run_agent(user_text or "Hello", config) or ""
 
     except asyncio.TimeoutError:
         final_response = "I'm taking a bit longer than usual — please try again in a moment."
     except Exception as exc:
-        print(f"❌ WhatsApp agent error: {exc}")
-        traceback.print_exc()
+        logger.exception("WhatsApp agent error: %s", exc)
         final_response = "I encountered a temporary error. Please try again."
 
     if not final_response:
@@ -629,18 +773,13 @@ async def vto_start(
     # Handle file upload
     image_path = None
     if file:
-        file.file.seek(0, 2)
-        size = file.file.tell()
-        file.file.seek(0)
-        if size > MAX_FILE_SIZE:
-            return _err("error")
-        ext = (file.filename.lower().split(".")[-1] if "." in file.filename else "")
-        if ext not in ALLOWED_EXTENSIONS:
+        ext = _upload_ext(file.filename)
+        if ext not in ALLOWED_EXTENSIONS or not await _has_image_header(file):
             return _err("error")
         safe_filename = f"{uuid.uuid4()}.{ext}"
         file_location = os.path.join(UPLOAD_DIR, safe_filename)
-        with open(file_location, "wb+") as f:
-            shutil.copyfileobj(file.file, f)
+        if not await save_upload(file, file_location):
+            return _err("error")
         image_path = file_location
 
     # Look up product
@@ -731,6 +870,13 @@ _PRODUCT_IMAGE_MAP: dict[str, str] = {
 _TRENDING_NAMES = list(_PRODUCT_IMAGE_MAP.keys())
 
 
+class TrendingProduct(BaseModel):
+    product_name: str
+    price: int
+    category: str
+    image_url: str | None
+
+
 def _resolve_image(product) -> str | None:
     """Return the best image URL for a product: map lookup → DB field → None."""
     mapped = _PRODUCT_IMAGE_MAP.get(product.product_name)
@@ -742,7 +888,7 @@ def _resolve_image(product) -> str | None:
     return None
 
 
-@app.get("/api/trending")
+@app.get("/api/trending", response_model=list[TrendingProduct])
 async def trending():
     """Return up to 12 trending products with image URLs for the frontend."""
     try:
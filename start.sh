@@ -1,10 +1,12 @@
 #!/bin/sh
 # Note: no "set -e" — a failed index build must not kill the container
 
-# Build FAISS index at first boot (Railway injects env vars at runtime, not build time)
-if [ ! -d "/app/faiss_index" ] || [ -z "$(ls -A /app/faiss_index 2>/dev/null)" ]; then
-    echo "[startup] faiss_index not found — building now..."
-    if python app/rag_indexer.py; then
+# Build FAISS index at first boot (Railway injects env vars at runtime, not build time).
+# An index without embedding_model.txt predates the tag check and would be
+# refused by create_rag_chain, so rebuild that too.
+if [ ! -f "/app/faiss_index/embedding_model.txt" ]; then
+    echo "[startup] tagged faiss_index not found — building now..."
+    if python -m app.rag_indexer; then
         echo "[startup] faiss_index built successfully"
     else
         echo "[startup] WARNING: faiss_index build failed — server will start without RAG"
@@ -0,0 +1,39 @@
+"""
+Unit tests for auto_link_images.write_excel.
+No network calls — only the local xlsx round trip.
+"""
+import pandas as pd
+import pytest
+
+import auto_link_images
+
+
+class TestWriteExcel:
+    def test_long_url_list_and_formula_text_round_trip(self, tmp_path):
+        urls = ",".join(
+            f"https://res.cloudinary.com/test-cloud/image/upload/v1/pamorya/wild_bloom_{i:03d}.jpg"
+            for i in range(40)
+        )
+        assert len(urls) > 2079   # past Excel's hyperlink length limit
+        df = pd.DataFrame({
+            "Dress Name": ["Wild Bloom", "=1+1"],
+            "image_url": [urls, "https://res.cloudinary.com/test-cloud/a.jpg"],
+            "Quantity for each": [3, None],
+        })
+        path = tmp_path / "out.xlsx"
+        auto_link_images.write_excel(df, str(path))
+
+        back = pd.read_excel(path)
+        assert back["image_url"].tolist() == df["image_url"].tolist()
+        assert back["Dress Name"].tolist() == ["Wild Bloom", "=1+1"]
+        assert back["Quantity for each"].iloc[0] == 3
+        assert pd.isna(back["Quantity for each"].iloc[1])
+
+    def test_no_cells_written_as_hyperlinks(self, tmp_path):
+        openpyxl = pytest.importorskip("openpyxl")
+        df = pd.DataFrame({"image_url": ["https://res.cloudinary.com/test-cloud/a.jpg"]})
+        path = tmp_path / "out.xlsx"
+        auto_link_images.write_excel(df, str(path))
+
+        sheet = openpyxl.load_workbook(path).active
+        assert sheet.cell(row=2, column=1).hyperlink is None
@@ -0,0 +1,162 @@
+"""
+Unit tests for db_builder.py — the Excel → DB sync helpers.
+Uses an in-memory SQLite database so no real PostgreSQL is needed.
+"""
+import os
+os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import pandas as pd
+from app.models import Base, Product, Inventory
+from app import db_builder
+from app.db_builder import stage_product, bulk_upsert
+
+
+@pytest.fixture(scope="function")
+def test_session():
+    """Fresh in-memory SQLite for each test."""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    yield session
+    session.close()
+    Base.metadata.drop_all(engine)
+
+
+def _stage(products, stock, img="https://example.com/a.jpg", qty=3, price=4500.0):
+    stage_product(products, stock, "Wild Bloom", "Dresses", price, "Floral", img, "Pink", None, 0)
+    stage_product(products, stock, "Wild Bloom", "Dresses", price, "Floral", img, "Pink", "s ", qty)
+    stage_product(products, stock, "Wild Bloom", "Dresses", price, "Floral", img, "Pink", "nan", 9)
+
+
+class TestStageProduct:
+    def test_sizes_are_normalised_and_invalid_ones_dropped(self):
+        products, stock = {}, {}
+        _stage(products, stock)
+        assert list(products) == [("Wild Bloom", "Pink")]
+        assert stock == {("Wild Bloom", "Pink", "S"): 3}
+
+    def test_missing_image_keeps_earlier_one(self):
+        products, stock = {}, {}
+        _stage(products, stock)
+        stage_product(products, stock, "Wild Bloom", "Dresses", 4000.0, "Floral", None, "Pink", None, 0)
+        assert products[("Wild Bloom", "Pink")]["image_url"] == "https://example.com/a.jpg"
+        assert products[("Wild Bloom", "Pink")]["price"] == 4000.0
+
+
+class TestBulkUpsert:
+    def test_inserts_products_and_stock(self, test_session):
+        products, stock = {}, {}
+        _stage(products, stock)
+        bulk_upsert(test_session, products, stock)
+        test_session.commit()
+
+        product = test_session.query(Product).one()
+        assert product.product_name == "Wild Bloom"
+        assert [(i.size, i.stock_quantity) for i in product.inventory] == [("S", 3)]
+
+    def test_rerun_updates_in_place(self, test_session):
+        products, stock = {}, {}
+        _stage(products, stock)
+        bulk_upsert(test_session, products, stock)
+        test_session.commit()
+
+        products, stock = {}, {}
+        _stage(products, stock, img=None, qty=7, price=3900.0)
+        bulk_upsert(test_session, products, stock)
+        test_session.commit()
+        test_session.expire_all()
+
+        product = test_session.query(Product).one()
+        assert product.price == 3900.0
+        assert product.image_url == "https://example.com/a.jpg"
+        assert test_session.query(Inventory).one().stock_quantity == 7
+
+
+class TestCopySeed:
+    def test_writes_csv_with_preassigned_ids(self):
+        products, stock = {}, {}
+        _stage(products, stock, img=None)
+        stage_product(products, stock, "Azure", "Blazers", 8000.0, "Sharp", "https://x/c.jpg", "", "M", 2)
+
+        copied = []
+        cur = MagicMock()
+        cur.copy_expert.side_effect = lambda sql, buf: copied.append((sql, buf.read()))
+        db = MagicMock()
+        db.connection().connection.dbapi_connection.cursor.return_value = cur
+
+        db_builder._copy_seed(db, products, stock)
+
+        (prod_sql, prod_csv), (inv_sql, inv_csv) = copied
+        assert prod_sql.startswith("COPY products")
+        assert prod_csv.splitlines() == [
+            r"1,Wild Bloom,Dresses,4500.0,Floral,\N,Pink",
+            "2,Azure,Blazers,8000.0,Sharp,https://x/c.jpg,",
+        ]
+        assert inv_csv.splitlines() == ["1,S,3", "2,M,2"]
+        assert "setval" in cur.execute.call_args[0][0]
+        cur.close.assert_called_once()
+
+
+class TestStockCache:
+    @pytest.fixture
+    def sheet(self, tmp_path):
+        path = tmp_path / "stock.xlsx"
+        pd.DataFrame({
+            "Dress Name": ["Dress Name: Wild Bloom", "Wild Bloom "],
+            "Colour": ["Pink", "Pink"],
+            "Unit Price (LKR)": [4500, None],
+            "Quantity Size": ["s", "m"],
+            "Quantity for each": [3, "Sold Out"],
+        }).to_excel(path, index=False)
+        return path
+
+    def test_clean_frame_is_typed(self, sheet, tmp_path):
+        df = db_builder._load_or_build_cached_df(str(sheet), str(tmp_path / "cache"))
+        assert df["Dress Name"].tolist() == ["Wild Bloom", "Wild Bloom"]
+        assert df["Quantity Size"].tolist() == ["S", "M"]
+        assert df["Quantity for each"].tolist() == [0, 0]   # sold out zeroes the product
+        assert df["image_url"].tolist() == ["", ""]
+
+    def test_second_load_skips_the_parse(self, sheet, tmp_path, monkeypatch):
+        cache = str(tmp_path / "cache")
+        first = db_builder._load_or_build_cached_df(str(sheet), cache)
+
+        def _fail(_):
+            raise AssertionError("sheet re-parsed despite fresh cache")
+        monkeypatch.setattr(db_builder, "_read_stock_sheet", _fail)
+        second = db_builder._load_or_build_cached_df(str(sheet), cache)
+        assert second["Dress Name"].tolist() == first["Dress Name"].tolist()
+
+    def test_replaced_sheet_with_older_mtime_is_reparsed(self, sheet, tmp_path):
+        cache = str(tmp_path / "cache")
+        db_builder._load_or_build_cached_df(str(sheet), cache)
+
+        pd.DataFrame({
+            "Dress Name": ["Sea Glass"],
+            "Colour": ["Blue"],
+            "Unit Price (LKR)": [5200],
+            "Quantity Size": ["l"],
+            "Quantity for each": [2],
+        }).to_excel(sheet, index=False)
+        os.utime(sheet, (0, 0))   # older than the cache file
+
+        df = db_builder._load_or_build_cached_df(str(sheet), cache)
+        assert df["Dress Name"].tolist() == ["Sea Glass"]
+        assert len(os.listdir(cache)) == 1   # the stale entry was dropped
+
+    def test_cleaning_version_bump_misses_the_cache(self, sheet, tmp_path, monkeypatch):
+        cache = str(tmp_path / "cache")
+        db_builder._load_or_build_cached_df(str(sheet), cache)
+
+        calls = []
+        real = db_builder._read_stock_sheet
+        monkeypatch.setattr(db_builder, "_read_stock_sheet", lambda p: calls.append(p) or real(p))
+        monkeypatch.setattr(db_builder, "_STOCK_CACHE_VERSION", db_builder._STOCK_CACHE_VERSION + 1)
+        db_builder._load_or_build_cached_df(str(sheet), cache)
+        assert calls == [str(sheet)]
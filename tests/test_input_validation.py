@@ -148,3 +148,97 @@ class TestFileExtensionValidation:
     @pytest.mark.parametrize("ext", ["exe", "sh", "php", "svg", "html", "py", "bat"])
     def test_blocked_extensions(self, ext):
         assert ext not in self.ALLOWED
+
+
+class TestAdminSchemaLimits:
+    """Admin payloads are bounded by the narrowed column types."""
+
+    @pytest.fixture
+    def schemas(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_SECRET_KEY", "test-admin-key")
+        from app import admin_router
+        return admin_router
+
+    def test_oversized_category_rejected(self, schemas):
+        from pydantic import ValidationError
+        with pytest.raises(ValidationError):
+            schemas.ProductUpdate(category="x" * 33)
+
+    def test_stock_above_smallint_rejected(self, schemas):
+        from pydantic import ValidationError
+        with pytest.raises(ValidationError):
+            schemas.InventoryCreate(product_id=1, size="M", stock_quantity=32768)
+
+    def test_values_within_limits_accepted(self, schemas):
+        row = schemas.InventoryUpdate(size="XL", stock_quantity=32767)
+        assert row.stock_quantity == 32767
+
+
+class TestUploadCopy:
+    """server._copy_upload, exec'd from source like the SSE checks in
+    test_smoke so the full agent stack isn't needed."""
+
+    SPOOL = 1024 * 1024   # Starlette's MultiPartParser.spool_max_size
+    LIMIT = 5 * 1024 * 1024
+
+    @pytest.fixture
+    def copy_upload(self):
+        import os
+        from starlette.formparsers import MultiPartParser
+
+        src_path = os.path.join(os.path.dirname(__file__), "..", "server.py")
+        with open(src_path, encoding="utf-8") as f:
+            src = f.read()
+        start = src.find("def _sendfile_upload")
+        end = src.find("\nasync def save_upload", start)
+        namespace = {"os": os, "MultiPartParser": MultiPartParser}
+        exec(src[start:end], namespace)
+        return namespace
+
+    def _spooled(self, body):
+        import tempfile
+        f = tempfile.SpooledTemporaryFile(max_size=self.SPOOL)
+        f.write(body)
+        f.seek(0)
+        return f
+
+    def test_body_over_spool_threshold_uses_sendfile(self, copy_upload, tmp_path, monkeypatch):
+        import os
+        if not hasattr(os, "sendfile"):
+            pytest.skip("no os.sendfile on this platform")
+        calls = []
+        real = os.sendfile
+        monkeypatch.setattr(os, "sendfile", lambda *a: calls.append(a) or real(*a))
+
+        body = os.urandom(self.SPOOL + 512 * 1024)
+        dest = tmp_path / "up.jpg"
+        assert copy_upload["_copy_upload"](self._spooled(body), str(dest), self.LIMIT)
+        assert calls, "sendfile fast path did not run"
+        assert dest.read_bytes() == body
+
+    def test_short_sendfile_falls_back_to_streaming(self, copy_upload, tmp_path, monkeypatch):
+        import os
+        real = os.sendfile if hasattr(os, "sendfile") else None
+
+        def _short(out_fd, in_fd, offset, count):
+            if offset:
+                return 0   # source "ends" early after the first chunk
+            return real(out_fd, in_fd, offset, min(count, 4096)) if real else 0
+        monkeypatch.setattr(os, "sendfile", _short, raising=False)
+
+        body = os.urandom(self.SPOOL + 4096)
+        dest = tmp_path / "up.jpg"
+        assert copy_upload["_copy_upload"](self._spooled(body), str(dest), self.LIMIT)
+        assert dest.read_bytes() == body
+
+    def test_oversized_spooled_body_rejected(self, copy_upload, tmp_path):
+        import os
+        dest = tmp_path / "up.jpg"
+        body = os.urandom(self.LIMIT + 1)
+        assert copy_upload["_copy_upload"](self._spooled(body), str(dest), self.LIMIT) is False
+        assert not dest.exists()
+
+    def test_in_memory_body_streams(self, copy_upload, tmp_path):
+        dest = tmp_path / "up.jpg"
+        assert copy_upload["_copy_upload"](self._spooled(b"\xff\xd8\xff" + b"x" * 100), str(dest), self.LIMIT)
+        assert dest.read_bytes() == b"\xff\xd8\xff" + b"x" * 100
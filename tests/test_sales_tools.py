@@ -349,3 +349,106 @@ class TestSalesToolBehaviours:
         assert parsed["items"][0]["name"] == "Crimson Canvas"
         assert parsed["total"] > 0
         assert "071791300" in parsed["message"]
+
+
+# ---------------------------------------------------------------------------
+# txn() — the shared commit/rollback context manager the tools run in
+# ---------------------------------------------------------------------------
+class TestTxn:
+    @pytest.fixture
+    def session_factory(self, test_session):
+        """SessionLocal stand-in bound to the test engine."""
+        return sessionmaker(bind=test_session.get_bind())
+
+    def test_commits_on_clean_exit(self, session_factory):
+        from app import sales_tools
+        with patch.object(sales_tools, "SessionLocal", session_factory):
+            with sales_tools.txn() as session:
+                session.add(Customer(customer_id="thread-txn", full_name="Guest"))
+
+        check = session_factory()
+        assert check.query(Customer).filter_by(customer_id="thread-txn").count() == 1
+        check.close()
+
+    def test_rolls_back_on_error(self, session_factory):
+        from app import sales_tools
+        with patch.object(sales_tools, "SessionLocal", session_factory):
+            with pytest.raises(RuntimeError):
+                with sales_tools.txn() as session:
+                    session.add(Customer(customer_id="thread-txn", full_name="Guest"))
+                    session.flush()
+                    raise RuntimeError("boom")
+
+        check = session_factory()
+        assert check.query(Customer).filter_by(customer_id="thread-txn").count() == 0
+        check.close()
+
+    def test_confirm_without_order_leaves_customer_untouched(self, session_factory):
+        from app import sales_tools
+        with patch.object(sales_tools, "SessionLocal", session_factory):
+            result = sales_tools.confirm_order_details.invoke({
+                "customer_name": "Viraj", "address": "Colombo",
+                "phone": "071791300", "thread_id": "thread-none",
+            })
+
+        assert result.startswith("Error: No pending order")
+        check = session_factory()
+        assert check.query(Customer).filter_by(customer_id="thread-none").count() == 0
+        check.close()
+
+    def test_draft_order_reuses_open_cart(self, session_factory, sample_product):
+        from app import sales_tools
+        with patch.object(sales_tools, "SessionLocal", session_factory):
+            first = sales_tools.create_draft_order.invoke({
+                "product_name": "Crimson", "size": "m", "quantity": 1, "thread_id": "thread-cart",
+            })
+            second = sales_tools.create_draft_order.invoke({
+                "product_name": "Crimson", "size": "m", "quantity": 2, "thread_id": "thread-cart",
+            })
+
+        assert first.startswith("SUCCESS") and second.startswith("SUCCESS")
+        assert "Cart total: LKR 138" in second   # 3 × 45.99
+        check = session_factory()
+        orders = check.query(Order).filter_by(customer_id="thread-cart").all()
+        assert len(orders) == 1
+        assert len(orders[0].items) == 2
+        check.close()
+
+    def test_remove_from_cart_decrements_total(self, session_factory, sample_product):
+        from app import sales_tools
+        with patch.object(sales_tools, "SessionLocal", session_factory):
+            for size, qty in (("M", 1), ("S", 2)):
+                sales_tools.create_draft_order.invoke({
+                    "product_name": "Crimson", "size": size, "quantity": qty,
+                    "thread_id": "thread-rm",
+                })
+            result = sales_tools.remove_from_cart.invoke({
+                "product_name": "Crimson", "thread_id": "thread-rm",
+            })
+
+        assert "Updated cart" in result
+        check = session_factory()
+        order = check.query(Order).filter_by(customer_id="thread-rm").one()
+        assert len(order.items) == 1
+        assert abs(order.total_amount - 2 * 45.99) < 0.01
+        check.close()
+
+    def test_bulk_add_inserts_all_rows_and_reports_misses(self, session_factory, sample_product):
+        from app import sales_tools
+        with patch.object(sales_tools, "SessionLocal", session_factory):
+            result = sales_tools.create_draft_order_bulk.invoke({
+                "items": [
+                    {"product_name": "Crimson", "size": "m", "quantity": 1},
+                    {"product_name": "Crimson", "size": "s", "quantity": 2},
+                    {"product_name": "Nonexistent", "size": "m"},
+                ],
+                "thread_id": "thread-bulk",
+            })
+
+        assert result.startswith("SUCCESS")
+        assert "Cart total: LKR 138" in result   # 3 × 45.99
+        assert "'Nonexistent' not found" in result
+        check = session_factory()
+        order = check.query(Order).filter_by(customer_id="thread-bulk").one()
+        assert sorted((i.size, i.quantity) for i in order.items) == [("M", 1), ("S", 2)]
+        check.close()
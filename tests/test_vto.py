@@ -44,7 +44,7 @@ class TestJobStatusStore:
 
     def test_estimated_seconds_remaining_decreases(self):
         import time
-        from app.vto_agent import set_job_status, get_job_status, _IN_MEMORY_JOBS, _job_key
+        from app.vto_agent import set_job_status, get_job_status, _IN_MEMORY_JOBS
         job_id = "test-job-timing"
         # Inject a job with started_at in the past
         payload = json.dumps({
@@ -55,7 +55,7 @@ class TestJobStatusStore:
             "message": "Processing...",
             "started_at": time.time() - 20,  # 20 seconds ago
         })
-        _IN_MEMORY_JOBS[_job_key(job_id)] = payload
+        _IN_MEMORY_JOBS[job_id] = (time.time() + 3600, payload)
         result = get_job_status(job_id)
         assert result["estimated_seconds_remaining"] <= 15  # 35 - 20 = 15
 
@@ -95,21 +95,22 @@ class TestFashnRetry:
         with patch("app.vto_agent._get_cached_result", return_value=None):
             with patch("cloudinary.uploader.upload", return_value={"secure_url": "https://cloud.jpg"}):
                 with patch("app.vto_agent.run_fashn_vto", new_callable=AsyncMock, return_value=None):
-                    with patch("app.vto_agent.run_replicate_vto_sync", return_value="https://replicate.jpg"):
-                        with patch("app.vto_agent.download_image_temp", return_value=str(tmp_path / "prod.jpg")):
-                            prod_img = tmp_path / "prod.jpg"
-                            prod_img.write_bytes(b"prod")
-                            with patch("os.path.exists", return_value=True):
-                                with patch("os.remove"):
-                                    from app.vto_agent import process_vto_job, get_job_status
-                                    await process_vto_job(
-                                        job_id="fallback-job",
-                                        thread_id="t2",
-                                        user_image_path=str(user_img),
-                                        product_image_url="https://product.jpg",
-                                        product_name="Blue Floral Bloom",
-                                        product_category="Tops & Blouses",
-                                    )
+                    with patch(
+                        "app.vto_agent.run_replicate_vto", new_callable=AsyncMock, return_value="https://replicate.jpg",
+                    ) as mock_replicate:
+                        from app.vto_agent import process_vto_job, get_job_status
+                        await process_vto_job(
+                            job_id="fallback-job",
+                            thread_id="t2",
+                            user_image_path=str(user_img),
+                            product_image_url="https://res.cloudinary.com/test-cloud/prod.jpg",
+                            product_name="Blue Floral Bloom",
+                            product_category="Tops & Blouses",
+                        )
+                        # Both images go to Replicate as URLs — nothing is downloaded or re-uploaded
+                        assert mock_replicate.await_args.args[:2] == (
+                            "https://cloud.jpg", "https://res.cloudinary.com/test-cloud/prod.jpg",
+                        )
 
         result = get_job_status("fallback-job")
         assert result["status"] == "completed"
@@ -123,7 +124,7 @@ class TestFashnRetry:
 
         with patch("app.vto_agent._get_cached_result", return_value=None):
             with patch("cloudinary.uploader.upload", side_effect=Exception("cloudinary down")):
-                with patch("app.vto_agent.download_image_temp", return_value=None):
+                with patch("app.vto_agent.run_replicate_vto", new_callable=AsyncMock, return_value=None):
                     from app.vto_agent import process_vto_job, get_job_status
                     with patch("os.path.exists", return_value=True):
                         await process_vto_job(
@@ -186,3 +187,172 @@ class TestFashnVtoFunction:
             vto_agent.FASHN_API_KEY = original_key
 
         assert result == "https://fashn.ai/result.jpg"
+
+
+class TestProductLookup:
+    """get_product_from_db prefers exact and prefix matches over substrings."""
+
+    @pytest.fixture
+    def session_factory(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.models import Base, Product
+
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(engine)
+        factory = sessionmaker(bind=engine)
+        with factory() as db:
+            db.add_all([
+                Product(product_name="Wild Bloom Whisper", category="Dresses", price=1, image_url="https://x/a.jpg"),
+                Product(product_name="Bloom Classic", category="Tops & Blouses", price=1, image_url="https://x/b.jpg"),
+                Product(product_name="Bloom", category="Skirts", price=1, image_url="https://x/c.jpg, https://x/d.jpg"),
+            ])
+            db.commit()
+        from app.vto_agent import _lookup
+        _lookup.cache_clear()
+        yield factory
+        _lookup.cache_clear()
+        engine.dispose()
+
+    def _lookup(self, factory, query):
+        from app import vto_agent
+        with patch.object(vto_agent, "SessionLocal", factory):
+            return vto_agent.get_product_from_db(query)
+
+    def test_exact_name_wins(self, session_factory):
+        result = self._lookup(session_factory, " bloom ")
+        assert result == {"name": "Bloom", "url": "https://x/c.jpg", "category": "Skirts"}
+
+    def test_prefix_beats_substring(self, session_factory):
+        assert self._lookup(session_factory, "Bloom Cl")["name"] == "Bloom Classic"
+
+    def test_substring_fallback(self, session_factory):
+        assert self._lookup(session_factory, "whisper")["name"] == "Wild Bloom Whisper"
+        assert self._lookup(session_factory, "Nope") is None
+
+    def test_repeat_lookup_is_cached(self, session_factory):
+        from app import vto_agent
+        assert self._lookup(session_factory, "Bloom")["name"] == "Bloom"
+        with patch.object(vto_agent, "SessionLocal", side_effect=AssertionError("hit the DB")):
+            assert vto_agent.get_product_from_db("  BLOOM")["name"] == "Bloom"
+
+
+class TestPublicImageUrl:
+    def test_legacy_local_paths_map_to_cloudinary(self):
+        from app.vto_agent import _public_image_url, CLOUDINARY_BASE_URL
+        assert _public_image_url("http://localhost:8000/product_images/PWBW01.jpg") == f"{CLOUDINARY_BASE_URL}PWBW01.jpg"
+        assert _public_image_url("https://res.cloudinary.com/x/a.jpg") == "https://res.cloudinary.com/x/a.jpg"
+
+
+class TestReplicateVto:
+    """run_replicate_vto awaits the async SDK and retries once on rate-limit."""
+
+    @pytest.mark.asyncio
+    async def test_retries_after_rate_limit(self, tmp_path):
+        from app import vto_agent
+        user_img = tmp_path / "u.jpg"
+        user_img.write_bytes(b"u")
+
+        run = AsyncMock(side_effect=[Exception("Request was throttled"), ["https://replicate.delivery/out.png"]])
+        with patch.object(vto_agent.replicate, "async_run", run):
+            with patch("asyncio.sleep", new_callable=AsyncMock) as sleep:
+                result = await vto_agent.run_replicate_vto(
+                    str(user_img), "https://res.cloudinary.com/x/p.jpg", "Crimson Canvas", "Dresses",
+                )
+
+        assert result == "https://replicate.delivery/out.png"
+        assert run.await_count == 2
+        sleep.assert_awaited_once_with(12)
+
+    @pytest.mark.asyncio
+    async def test_public_user_image_is_passed_as_url(self):
+        from app import vto_agent
+        run = AsyncMock(return_value="https://replicate.delivery/out.png")
+        with patch.object(vto_agent.replicate, "async_run", run):
+            await vto_agent.run_replicate_vto(
+                "https://res.cloudinary.com/x/u.jpg", "https://res.cloudinary.com/x/p.jpg", "Crimson Canvas", "Dresses",
+            )
+        sent = run.await_args.kwargs["input"]
+        assert sent["human_img"] == "https://res.cloudinary.com/x/u.jpg"
+        assert sent["garm_img"] == "https://res.cloudinary.com/x/p.jpg"
+
+
+class TestDailyLimit:
+    """check_and_increment_limit counts atomically and resets on a new day."""
+
+    @pytest.fixture
+    def db(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.models import Base
+
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        yield session
+        session.close()
+        engine.dispose()
+
+    def test_refuses_past_limit(self, db):
+        from app.models import VtoSession
+        from app.vto_agent import check_and_increment_limit
+        assert [check_and_increment_limit(db, "t", daily_limit=2) for _ in range(3)] == [True, True, False]
+        db.commit()
+        assert db.get(VtoSession, "t").usage_count == 2
+
+    def test_new_day_resets_count(self, db):
+        from app.models import VtoSession
+        from app.vto_agent import check_and_increment_limit
+        db.add(VtoSession(thread_id="t", usage_count=5, usage_date="2000-01-01"))
+        db.commit()
+        assert check_and_increment_limit(db, "t", daily_limit=5)
+        db.commit()
+        db.expire_all()
+        assert db.get(VtoSession, "t").usage_count == 1
+
+
+class TestInMemoryJobStore:
+    def test_expired_jobs_are_evicted(self, monkeypatch):
+        from app import vto_agent
+        monkeypatch.setattr(vto_agent, "_IN_MEMORY_JOBS", {"stale-job": (0.0, "{}")})
+        vto_agent.set_job_status("fresh-job", "queued")
+        assert list(vto_agent._IN_MEMORY_JOBS) == ["fresh-job"]
+        assert vto_agent.get_job_status("fresh-job")["status"] == "queued"
+
+
+class TestHandleVtoMessage:
+    """DB work runs on a worker thread; the generation job starts on the loop."""
+
+    @pytest.fixture
+    def session_factory(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import StaticPool
+        from app.models import Base
+
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool,
+        )
+        Base.metadata.create_all(engine)
+        yield sessionmaker(bind=engine)
+        engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_photo_then_product_launches_job(self, session_factory):
+        from app import vto_agent
+        product = {"name": "Crimson Canvas", "url": "https://x/p.jpg", "category": "Dresses"}
+        job = AsyncMock()
+        with patch.object(vto_agent, "SessionLocal", session_factory), \
+                patch.object(vto_agent, "get_product_from_db", return_value=product), \
+                patch.object(vto_agent, "_get_cached_result", return_value=None), \
+                patch.object(vto_agent, "process_vto_job", job):
+            first = await vto_agent.handle_vto_message("t-vto", "", "/tmp/user.jpg")
+            reply = await vto_agent.handle_vto_message("t-vto", "crimson canvas")
+            await asyncio.sleep(0)
+
+        assert first == vto_agent.STEP2_GUIDANCE
+        assert "Generating your look with **Crimson Canvas**" in reply
+        kwargs = job.await_args.kwargs
+        assert kwargs["user_image_path"] == "/tmp/user.jpg"
+        assert kwargs["product_category"] == "Dresses"
+        assert vto_agent.get_job_status(kwargs["job_id"])["status"] == "queued"